@@ -66,11 +66,14 @@ def run_submission_grading(course_name: str, model: str = "gpt-4o") -> Optional[
         
         # Submissions downloaden
         print(f"\n  Lade Submissions...")
-        submissions_dict = downloader.download_assignment_submissions(
-            course_id=course_id,
-            target_dir="test_submissions",
-            only_submitted=True
-        )
+        try:
+            submissions_dict = downloader.download_assignment_submissions(
+                course_id=course_id,
+                target_dir="test_submissions",
+                only_submitted=True
+            )
+        finally:
+            downloader.close()
         
         if not submissions_dict:
             print("  Keine Submissions gefunden!")
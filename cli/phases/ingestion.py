@@ -35,18 +35,19 @@ def run_ingestion(shortname: str) -> Tuple[DocumentManager, str, str]:
     # Moodle-Verbindung aufbauen
     client, downloader = get_moodle_client()
     
-    # Kurs finden
-    course = find_course(downloader, shortname)
-    course_id = course['id']
-    course_name = shortname
-    
-    # Download-Ordner vorbereiten
-    download_dir = f"downloads/{course_name}"
-    Path(download_dir).mkdir(parents=True, exist_ok=True)
-    logger.info(f"Download-Verzeichnis: {download_dir}")
-    
-    # Kursinhalte herunterladen
-    files, assignments = download_course_content(downloader, course_id, download_dir)
+    with downloader:
+        # Kurs finden
+        course = find_course(downloader, shortname)
+        course_id = course['id']
+        course_name = shortname
+        
+        # Download-Ordner vorbereiten
+        download_dir = f"downloads/{course_name}"
+        Path(download_dir).mkdir(parents=True, exist_ok=True)
+        logger.info(f"Download-Verzeichnis: {download_dir}")
+        
+        # Kursinhalte herunterladen
+        files, assignments = download_course_content(downloader, course_id, download_dir)
     
     # DocumentManager initialisieren
     logger.info("Initialisiere DocumentManager...")
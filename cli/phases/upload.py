@@ -44,8 +44,9 @@ def run_moodle_upload(course_name: str) -> Optional[Dict]:
         print("  MOODLE_URL und MOODLE_TOKEN müssen in .env gesetzt sein")
         return None
     
+    client = None
     try:
-        # Moodle Client
+        # Moodle Client (eine Session für Upload und Topic-Updates)
         client = MoodleClient(moodle_url, moodle_token)
         
         # Teste Verbindung
@@ -121,6 +122,9 @@ def run_moodle_upload(course_name: str) -> Optional[Dict]:
         logger.error(f"Fehler bei Moodle-Upload: {e}")
         print(f"  Fehler: {e}")
         return None
+    finally:
+        if client:
+            client.close()
 
 
 def check_neo4j_data(course_name: str) -> bool:
@@ -1,7 +1,17 @@
 # llm/feedback/base.py
 
+import asyncio
+import os
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import cached_property
+from hashlib import blake2b
+from logging import DEBUG
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from llm.feedback.types import FeedbackResult
+from llm.shared.incremental_json import IncrementalJSONParser
 from logger import get_logger
 
 
@@ -10,15 +20,30 @@ class CompetencyLLM(ABC):
     Interface für LLMs, die studentische Abgaben in Bezug auf Zielkompetenzen bewerten.
     """
 
+    # Pflichtfelder der LLM-Antwort - sobald alle da sind, kann der Stream enden
+    REQUIRED_FIELDS = tuple(FeedbackResult.model_fields)
+
+    # Ergebnis-Cache und laufende Requests, geteilt über alle Instanzen,
+    # da pro Bewertung oft eine neue LLM-Instanz erzeugt wird.
+    # Abschaltbar mit FEEDBACK_CACHE=false in .env
+    RESULT_CACHE_SIZE = 1024
+    _result_cache: "OrderedDict[str, FeedbackResult]" = OrderedDict()
+    _inflight: Dict[str, Future] = {}
+    _cache_lock = threading.Lock()
+
     def __init__(self):
         self.logger = get_logger(self.__class__.__module__)
         self.logger.debug("CompetencyLLM initialisiert für: %s", self.__class__.__name__)
+        self.use_cache = os.getenv("FEEDBACK_CACHE", "true").lower() != "false"
 
-    @abstractmethod
     def evaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
         """
         Bewertet eine studentische Abgabe.
 
+        Identische Anfragen (Provider, Modell, Prompt) werden nur einmal ans LLM
+        geschickt: fertige Ergebnisse kommen aus einem LRU-Cache, gleichzeitige
+        Duplikate warten auf denselben laufenden Request.
+
         Args:
             abgabe (str): Code oder Text der Abgabe
             kompetenz (str): Zielkompetenz, z.B. "Verwendung von Kontrollstrukturen"
@@ -26,4 +51,168 @@ class CompetencyLLM(ABC):
         Returns:
             FeedbackResult: strukturiertes Feedback-Objekt mit Bewertung & Tipps
         """
-        pass
\ No newline at end of file
+        if not self.use_cache:
+            return self._evaluate(abgabe, kompetenz)
+
+        key = self._cache_key(abgabe, kompetenz)
+        cached, future, owner = self._claim(key)
+        if cached is not None:
+            return cached
+        if not owner:
+            self.logger.debug("Identischer Request läuft bereits, warte auf Ergebnis")
+            return future.result()
+
+        try:
+            result = self._evaluate(abgabe, kompetenz)
+        except BaseException as e:
+            self._release(key, future, exception=e)
+            raise
+        self._release(key, future, result=result)
+        return result
+
+    async def aevaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
+        """Asynchrone Variante von evaluate() mit demselben Cache."""
+        if not self.use_cache:
+            return await self._aevaluate(abgabe, kompetenz)
+
+        key = self._cache_key(abgabe, kompetenz)
+        cached, future, owner = self._claim(key)
+        if cached is not None:
+            return cached
+        if not owner:
+            self.logger.debug("Identischer Request läuft bereits, warte auf Ergebnis")
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await self._aevaluate(abgabe, kompetenz)
+        except BaseException as e:
+            self._release(key, future, exception=e)
+            raise
+        self._release(key, future, result=result)
+        return result
+
+    @abstractmethod
+    def _evaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
+        """Führt die eigentliche (ungecachte) Bewertung über das LLM aus."""
+        pass
+
+    async def _aevaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
+        """
+        Asynchrone Variante von _evaluate().
+
+        Standard: führt _evaluate() in einem Worker-Thread aus. Implementierungen
+        mit async-fähigem Client überschreiben dies mit einem echten ainvoke().
+        """
+        return await asyncio.to_thread(self._evaluate, abgabe, kompetenz)
+
+    @cached_property
+    def _key_hash(self):
+        """Vorbefüllter Hash aus Klasse, Modell und Template-Text (einmal pro Instanz)."""
+        template = getattr(self.prompt_template, "template", None) or repr(self.prompt_template)
+        raw = f"{self.__class__.__name__}|{self.model_name}|{template}"
+        return blake2b(raw.encode("utf-8"), digest_size=16)
+
+    def _cache_key(self, abgabe: str, kompetenz: str) -> str:
+        # Template + Eingaben bestimmen den Prompt eindeutig - kein Rendern
+        # nur für den Key, das erledigt die Chain ohnehin selbst
+        h = self._key_hash.copy()
+        for part in (kompetenz, abgabe):
+            h.update(b"\x1f")
+            h.update(part.encode("utf-8"))
+        return h.hexdigest()
+
+    def _claim(self, key: str) -> Tuple[Optional[FeedbackResult], Optional[Future], bool]:
+        """
+        Prüft Cache und laufende Requests für einen Key.
+
+        Returns:
+            (Cache-Treffer, Future des laufenden Requests, True wenn der Aufrufer
+            den Request selbst ausführen muss)
+        """
+        with self._cache_lock:
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                self._result_cache.move_to_end(key)
+                self.logger.debug("Feedback-Cache-Hit")
+                return cached, None, False
+
+            future = self._inflight.get(key)
+            if future is not None:
+                return None, future, False
+
+            future = Future()
+            self._inflight[key] = future
+            return None, future, True
+
+    def _release(self, key: str, future: Future, result: Optional[FeedbackResult] = None,
+                 exception: Optional[BaseException] = None):
+        """Legt das Ergebnis im Cache ab und weckt wartende Duplikate."""
+        with self._cache_lock:
+            if exception is None:
+                self._result_cache[key] = result
+                if len(self._result_cache) > self.RESULT_CACHE_SIZE:
+                    self._result_cache.popitem(last=False)
+            self._inflight.pop(key, None)
+
+        if exception is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exception)
+
+    async def evaluate_many(self, abgabe: str, kompetenzen: List[str],
+                            max_concurrency: int = 8) -> List[FeedbackResult]:
+        """
+        Bewertet eine Abgabe gegen mehrere Kompetenzen mit parallelen LLM-Aufrufen.
+
+        Args:
+            abgabe: Code oder Text der Abgabe
+            kompetenzen: Liste von Zielkompetenzen
+            max_concurrency: Maximale Anzahl gleichzeitiger Requests
+
+        Returns:
+            FeedbackResults in der Reihenfolge der Kompetenzen
+        """
+        sem = asyncio.Semaphore(max_concurrency)
+
+        async def _one(kompetenz: str) -> FeedbackResult:
+            async with sem:
+                return await self.aevaluate(abgabe, kompetenz)
+
+        self.logger.debug("evaluate_many(): %d Kompetenzen, max. %d parallel",
+                          len(kompetenzen), max_concurrency)
+        return await asyncio.gather(*[_one(k) for k in kompetenzen])
+
+    def evaluate_many_sync(self, abgabe: str, kompetenzen: List[str],
+                           max_concurrency: int = 8) -> List[FeedbackResult]:
+        """Synchroner Wrapper um evaluate_many() für Aufrufer ohne Event-Loop."""
+        return asyncio.run(self.evaluate_many(abgabe, kompetenzen, max_concurrency))
+
+    def _consume_stream(self, chunks: Iterable[Any]) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        Liest einen LLM-Stream und parst die JSON-Felder, während sie eintreffen.
+
+        Bricht den Stream ab, sobald alle Pflichtfelder vollständig sind.
+
+        Returns:
+            (Felder oder None wenn unvollständig, bisher empfangene Rohantwort)
+        """
+        parser = IncrementalJSONParser()
+        raw_parts = []
+        debug = self.logger.isEnabledFor(DEBUG)
+
+        for chunk in chunks:
+            content = chunk.content
+            if not isinstance(content, str):
+                continue
+            raw_parts.append(content)
+            events = parser.feed(content)
+            if debug:
+                for path, _ in events:
+                    self.logger.debug("Feld empfangen: %s", path[0])
+            if parser.has_fields(self.REQUIRED_FIELDS):
+                break
+
+        raw = "".join(raw_parts)
+        if parser.has_fields(self.REQUIRED_FIELDS):
+            return parser.fields, raw
+        return None, raw
@@ -6,15 +6,21 @@ from llm.feedback.types import FeedbackResult
 from llm.shared.llm_factory import get_llm
 from llm.shared.json_utils import clean_json_response
 import json
+from logging import DEBUG
 
 
 class ClaudeLLM(CompetencyLLM):
     def __init__(self, prompt_template: PromptTemplate, model: str = None, model_type: str = "fast"):
         super().__init__()  # Initialisiert Logger
         self.prompt_template = prompt_template
+        self._raw_template: str = prompt_template.template
+
+        # Direktes Rendern ohne LangChain-Validierung: str.format auf dem Roh-Template
+        self._format_prompt = self._raw_template.format
 
         # Nutze das spezifische Model wenn gegeben, sonst Default
         if model:
+            self.model_name = model
             self.llm = get_llm(model=model, temperature=0.2)
         else:
             # Fallback auf Default-Modelle
@@ -23,32 +29,55 @@ class ClaudeLLM(CompetencyLLM):
                 "good": "claude-3-5-sonnet-20241022",
                 "best": "claude-3-opus-20240229"
             }
-            self.llm = get_llm(model=model_map.get(model_type, "claude-3-haiku-20240307"), temperature=0.2)
+            self.model_name = model_map.get(model_type, "claude-3-haiku-20240307")
+            self.llm = get_llm(model=self.model_name, temperature=0.2)
 
-        self.logger.debug("Prompt-Template initialisiert:\n%s", self.prompt_template.template)
+        if self.logger.isEnabledFor(DEBUG):
+            self.logger.debug("Prompt-Template initialisiert:\n%s", self.prompt_template.template)
 
-    def evaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
-        self.logger.debug("Aufruf von evaluate() mit:")
-        self.logger.debug("Kompetenz:\n%s", kompetenz)
-        self.logger.debug("Abgabe:\n%s", abgabe)
+    def _evaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
+        if self.logger.isEnabledFor(DEBUG):
+            self.logger.debug("Aufruf von evaluate() mit:")
+            self.logger.debug("Kompetenz:\n%s", kompetenz)
+            self.logger.debug("Abgabe:\n%s", abgabe)
 
         try:
-            prompt_str = self.prompt_template.format(abgabe=abgabe, kompetenz=kompetenz)
-            self.logger.debug("Formatierter Claude-Prompt:\n%s", prompt_str)
+            prompt_str = self._format_prompt(abgabe=abgabe, kompetenz=kompetenz)
+            if self.logger.isEnabledFor(DEBUG):
+                self.logger.debug("Formatierter Claude-Prompt:\n%s", prompt_str)
 
-            response = self.llm.invoke([HumanMessage(content=prompt_str)])
-            self.logger.debug("LLM-Rohantwort:\n%s", response.content)
+            # Felder werden geparst, während die Antwort noch gestreamt wird
+            parsed, raw_content = self._consume_stream(
+                self.llm.stream([HumanMessage(content=prompt_str)])
+            )
+            if self.logger.isEnabledFor(DEBUG):
+                self.logger.debug("LLM-Rohantwort:\n%s", raw_content)
         except Exception as e:
             self.logger.error("Fehler beim LLM-Aufruf: %s", e)
             raise
 
+        return self._to_feedback(parsed, raw_content)
+
+    async def _aevaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
         try:
-            # WICHTIG: Bereinige die Antwort mit Claude-spezifischer Logik!
-            cleaned_content = clean_json_response(response.content, provider="claude")
-            parsed = json.loads(cleaned_content)
+            prompt_str = self._format_prompt(abgabe=abgabe, kompetenz=kompetenz)
+            response = await self.llm.ainvoke([HumanMessage(content=prompt_str)])
         except Exception as e:
-            self.logger.error("Fehler beim Parsen der Antwort: %s", e)
-            raise ValueError(f"Claude-Rückgabe konnte nicht geparsed werden: {e}\nAntwort war:\n{response.content}")
+            self.logger.error("Fehler beim LLM-Aufruf: %s", e)
+            raise
+
+        return self._to_feedback(None, response.content)
+
+    def _to_feedback(self, parsed, raw_content: str) -> FeedbackResult:
+        """Baut das FeedbackResult; parst die Rohantwort, falls nötig."""
+        if parsed is None:
+            try:
+                # WICHTIG: Bereinige die Antwort mit Claude-spezifischer Logik!
+                cleaned_content = clean_json_response(raw_content, provider="claude")
+                parsed = json.loads(cleaned_content)
+            except Exception as e:
+                self.logger.error("Fehler beim Parsen der Antwort: %s", e)
+                raise ValueError(f"Claude-Rückgabe konnte nicht geparsed werden: {e}\nAntwort war:\n{raw_content}")
 
         if isinstance(parsed.get("kompetenz_erfüllt"), bool):
             parsed["kompetenz_erfüllt"] = (
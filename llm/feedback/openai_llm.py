@@ -2,9 +2,13 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import Runnable
 from llm.feedback.base import CompetencyLLM
 from llm.feedback.types import FeedbackResult
-from llm.shared.llm_factory import get_llm
+from llm.shared.llm_factory import get_llm, supports_json_mode
 from llm.shared.json_utils import clean_json_response, parse_llm_json
 import json
+from logging import DEBUG
+import orjson
+
+JSON_MODE = {"type": "json_object"}
 
 
 class OpenAILLM(CompetencyLLM):
@@ -15,7 +19,8 @@ class OpenAILLM(CompetencyLLM):
         
         # Nutze das spezifische Model wenn gegeben, sonst Default
         if model:
-            llm = get_llm(model=model, temperature=0.2)
+            self.model_name = model
+            llm = get_llm(model=model, temperature=0.2, response_format=JSON_MODE)
         else:
             # Fallback auf Default-Modelle
             model_map = {
@@ -23,37 +28,70 @@ class OpenAILLM(CompetencyLLM):
                 "good": "gpt-4o",
                 "best": "o1-2024-12-17"
             }
-            llm = get_llm(model=model_map.get(model_type, "gpt-4o-mini"), temperature=0.2)
+            self.model_name = model_map.get(model_type, "gpt-4o-mini")
+            llm = get_llm(model=self.model_name, temperature=0.2, response_format=JSON_MODE)
         self.chain: Runnable = self.prompt_template | llm
 
-        self.logger.debug("Prompt-Template initialisiert:\n%s", self.prompt_template.template)
+        # Im JSON-Mode ist die Antwort garantiert valides JSON - keine Bereinigung nötig
+        self._json_mode = supports_json_mode(self.model_name)
+
+        if self.logger.isEnabledFor(DEBUG):
+            self.logger.debug("Prompt-Template initialisiert:\n%s", self.prompt_template.template)
 
-    def evaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
+    def _evaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
         # Logge die Inputs, die ans LLM gehen
-        self.logger.debug("Aufruf von evaluate() mit:")
-        self.logger.debug("Kompetenz:\n%s", kompetenz)
-        self.logger.debug("Abgabe:\n%s", abgabe)
+        if self.logger.isEnabledFor(DEBUG):
+            self.logger.debug("Aufruf von evaluate() mit:")
+            self.logger.debug("Kompetenz:\n%s", kompetenz)
+            self.logger.debug("Abgabe:\n%s", abgabe)
 
         try:
-            response = self.chain.invoke({
+            # Felder werden geparst, während die Antwort noch gestreamt wird
+            parsed, raw_content = self._consume_stream(self.chain.stream({
                 "kompetenz": kompetenz,
                 "abgabe": abgabe
-            })
-            self.logger.debug("LLM-Rohantwort:\n%s", response.content)
+            }))
+            if self.logger.isEnabledFor(DEBUG):
+                self.logger.debug("LLM-Rohantwort:\n%s", raw_content)
         except Exception as e:
             self.logger.error("Fehler beim Aufruf der LLM-Chain: %s", e)
             raise
 
+        return self._to_feedback(parsed, raw_content)
+
+    async def _aevaluate(self, abgabe: str, kompetenz: str) -> FeedbackResult:
         try:
-            # WICHTIG: Bereinige die Antwort vor dem Parsen!
-            cleaned_content = clean_json_response(response.content)
-            self.logger.debug(" JSON Response (bereinigt):\n%s", cleaned_content)
-            parsed = json.loads(cleaned_content)
-            self.logger.debug(" Parsed JSON: %s", parsed)
+            response = await self.chain.ainvoke({
+                "kompetenz": kompetenz,
+                "abgabe": abgabe
+            })
         except Exception as e:
-            self.logger.error("Fehler beim Parsen der Antwort: %s", e)
-            self.logger.error("Raw response war: %s", response.content)
-            raise ValueError(f"Fehler beim Parsen der LLM-Antwort: {e}\nAntwort war:\n{response.content}")
+            self.logger.error("Fehler beim Aufruf der LLM-Chain: %s", e)
+            raise
+
+        return self._to_feedback(None, response.content)
+
+    def _to_feedback(self, parsed, raw_content: str) -> FeedbackResult:
+        """Baut das FeedbackResult; parst die Rohantwort, falls nötig."""
+        if parsed is None and self._json_mode:
+            try:
+                parsed = orjson.loads(raw_content)
+            except orjson.JSONDecodeError as e:
+                self.logger.warning("JSON-Mode-Antwort nicht direkt parsebar, bereinige: %s", e)
+
+        if parsed is None:
+            try:
+                # WICHTIG: Bereinige die Antwort vor dem Parsen!
+                cleaned_content = clean_json_response(raw_content)
+                if self.logger.isEnabledFor(DEBUG):
+                    self.logger.debug(" JSON Response (bereinigt):\n%s", cleaned_content)
+                parsed = json.loads(cleaned_content)
+            except Exception as e:
+                self.logger.error("Fehler beim Parsen der Antwort: %s", e)
+                self.logger.error("Raw response war: %s", raw_content)
+                raise ValueError(f"Fehler beim Parsen der LLM-Antwort: {e}\nAntwort war:\n{raw_content}")
+        if self.logger.isEnabledFor(DEBUG):
+            self.logger.debug(" Parsed JSON: %s", parsed)
 
         # ️ Soft-Fallback
         if isinstance(parsed.get("kompetenz_erfüllt"), bool):
@@ -38,6 +38,9 @@ class FeedbackPromptBuilder:
         "text": None  # Spezialfall für Text
     }
     
+    # Fertige Prompts pro task_type
+    _PROMPT_CACHE: Dict[str, PromptTemplate] = {}
+    
     # Einheitliches Template für alle Programmiersprachen
     CODE_TEMPLATE = """Du bist ein empathischer Informatik-Dozent mit Expertise in {language}-Programmierung.
 Du bewertest keine Aufgaben im Sinne von Noten, sondern gibst personalisiertes, 
@@ -114,12 +117,18 @@ Bitte antworte im JSON-Format mit GENAU diesen Feldern:
         """
         task_type = task_type.lower()
         
+        cached = cls._PROMPT_CACHE.get(task_type)
+        if cached is not None:
+            return cached
+        
         # Spezialfall: Text
         if task_type == "text":
-            return PromptTemplate(
+            prompt = PromptTemplate(
                 input_variables=["kompetenz", "abgabe"],
                 template=cls.TEXT_TEMPLATE
             )
+            cls._PROMPT_CACHE[task_type] = prompt
+            return prompt
         
         # Programmiersprachen
         if task_type in cls.LANGUAGE_MAP:
@@ -133,10 +142,12 @@ Bitte antworte im JSON-Format mit GENAU diesen Feldern:
                 language_lower=task_type
             )
             
-            return PromptTemplate(
+            prompt = PromptTemplate(
                 input_variables=["kompetenz", "abgabe"],
                 template=filled_template
             )
+            cls._PROMPT_CACHE[task_type] = prompt
+            return prompt
         
         raise ValueError(
             f"Unbekannter Task-Type: {task_type}. "
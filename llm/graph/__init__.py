@@ -1,7 +1,9 @@
 from .models import Document, Competency, Exercise, LearningGoal
 from .neo4j_client import GraphDatabase
 from .graph_ingestion import GraphIngestion
-from .graph_queries import GraphQueries
+from .graph_queries import (
+    GraphQueries, RelatedDocument, TaughtCompetency, CompetencyDocument, SimilarExercise
+)
 
 __all__ = [
     "Document",
@@ -10,5 +12,9 @@ __all__ = [
     "LearningGoal",
     "GraphDatabase",
     "GraphIngestion",
-    "GraphQueries"
+    "GraphQueries",
+    "RelatedDocument",
+    "TaughtCompetency",
+    "CompetencyDocument",
+    "SimilarExercise"
 ]
\ No newline at end of file
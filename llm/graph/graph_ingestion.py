@@ -2,16 +2,32 @@ from typing import List, Dict, Any, Optional, Tuple
 from langchain_core.documents import Document as LangchainDoc
 from .models import Document, Competency, Lecture, Exercise
 from .neo4j_client import GraphDatabase
-from llm.shared.llm_factory import get_embedding_model
+from llm.shared.llm_factory import get_embedding_model, EMBEDDING_MODEL
 from logger import get_logger
 from datetime import datetime
+from pathlib import PurePosixPath
 import numpy as np
 import json
 
 logger = get_logger(__name__)
 
+# Neo4j String-Limit für Document.content (in UTF-8 Bytes)
+MAX_CONTENT_BYTES = 5000
+
+
+def _truncate_utf8(text: str, max_bytes: int = MAX_CONTENT_BYTES) -> str:
+    """
+    Kürzt einen String auf max_bytes UTF-8 Bytes, ohne Zeichen zu zerschneiden.
+    Schneidet zuerst auf max_bytes Zeichen, damit nie der komplette
+    (evtl. mehrere MB große) String kodiert werden muss.
+    """
+    return text[:max_bytes].encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+
 
 class GraphIngestion:
+    # Maximale Zeilen pro UNWIND-Batch
+    LINK_BATCH_SIZE = 500
+    
     def __init__(self):
         self.db = GraphDatabase()
         self.db.create_constraints()
@@ -25,7 +41,9 @@ class GraphIngestion:
             logger.warning(f" Embeddings nicht verfügbar: {e}")
         
         # Cache für Embeddings um API Calls zu reduzieren
-        self._embedding_cache = {}
+        # Vektoren als float32-Arrays, Normen separat gecacht
+        self._embedding_cache: Dict[str, np.ndarray] = {}
+        self._norm_cache: Dict[str, float] = {}
         
     def ingest_document(self, 
                        langchain_doc: LangchainDoc,
@@ -49,9 +67,9 @@ class GraphIngestion:
         
         # Erstelle Document-Knoten mit eindeutiger ID basierend auf Dateiname
         # Extrahiere Dateiname ohne Pfad und Erweiterung
-        import os
-        filename = os.path.basename(file_path)
-        filename_without_ext = os.path.splitext(filename)[0]
+        path = PurePosixPath(file_path)
+        filename = path.name
+        filename_without_ext = path.stem
         doc_id = f"{lecture_info['lecture_name']}_{filename_without_ext}"
         
         # Besserer Title: Verwende Dateinamen oder custom title
@@ -60,10 +78,12 @@ class GraphIngestion:
             # Wenn nur generischer "Folie X" Title, verwende Dateinamen
             title = filename  # Mit Erweiterung
         
+        content_snippet = _truncate_utf8(langchain_doc.page_content)
+        
         doc = Document.get_or_create({
             "doc_id": doc_id,
             "title": title,
-            "content": langchain_doc.page_content[:5000],  # Neo4j String limit
+            "content": content_snippet,  # Neo4j String limit
             "doc_type": doc_type,
             "lecture_name": lecture_info["lecture_name"],
             "semester": lecture_info.get("semester", "unknown"),
@@ -96,19 +116,22 @@ class GraphIngestion:
         # einfach den Ordnernamen als Kursnamen, später noch mapping evtl
         return abbrev
     
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """Berechne Cosine Similarity zwischen zwei Vektoren."""
-        vec1 = np.array(vec1)
-        vec2 = np.array(vec2)
-        
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
+    def _embed(self, text: str) -> np.ndarray:
+        """Erzeugt ein Embedding als float32-Array (einmalige Kopie aus der API-Liste)."""
+        return np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+    
+    def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray,
+                           norm1: Optional[float] = None, norm2: Optional[float] = None) -> float:
+        """Berechne Cosine Similarity zwischen zwei Vektoren (Normen optional vorberechnet)."""
+        if norm1 is None:
+            norm1 = float(np.linalg.norm(vec1))
+        if norm2 is None:
+            norm2 = float(np.linalg.norm(vec2))
         
         if norm1 == 0 or norm2 == 0:
             return 0.0
         
-        return dot_product / (norm1 * norm2)
+        return float(vec1 @ vec2 / (norm1 * norm2))
     
     def create_or_get_similar_competency(self,
                                         name: str,
@@ -118,7 +141,8 @@ class GraphIngestion:
                                         similarity_threshold: float = 0.85) -> Tuple[Competency, bool]:
         """
         Erstelle eine neue Kompetenz oder nutze eine existierende ähnliche.
-        Nutzt Embeddings zur Similarity-Berechnung, speichert diese aber nicht.
+        Nutzt Embeddings zur Similarity-Berechnung und speichert sie am
+        Competency-Knoten, damit spätere Läufe sie nicht neu berechnen müssen.
         
         Returns:
             Tuple[Competency, bool]: (Kompetenz-Objekt, True wenn wiederverwendet)
@@ -134,7 +158,8 @@ class GraphIngestion:
         # Nutze nur den Namen für Similarity, da Beschreibungen oft generisch sind
         comp_text = name
         logger.info(f"   Generiere Embedding für neue Kompetenz: {comp_text[:50]}...")
-        new_embedding = self.embeddings.embed_query(comp_text)
+        new_embedding = self._embed(comp_text)
+        new_norm = float(np.linalg.norm(new_embedding))
         logger.info(f"   Embedding generiert (Länge: {len(new_embedding)})")
         
         # Hole nur existierende Kompetenzen des aktuellen Kurses
@@ -167,22 +192,46 @@ class GraphIngestion:
             if existing_text in self._embedding_cache:
                 # Cache Hit! Kein API Call nötig
                 existing_embedding = self._embedding_cache[existing_text]
+                existing_norm = self._norm_cache[existing_text]
                 cache_hits += 1
                 logger.debug(f"     Cache-Hit für '{comp.name}'")
+            elif (comp.embedding and comp.embedding_model == EMBEDDING_MODEL
+                  and len(comp.embedding) == len(new_embedding)):
+                # Persistiertes Embedding aus Neo4j - ebenfalls kein API Call
+                # (nur wenn es vom aktuellen Modell stammt, sonst neu erzeugen)
+                existing_embedding = np.asarray(comp.embedding, dtype=np.float32)
+                existing_norm = float(np.linalg.norm(existing_embedding))
+                self._embedding_cache[existing_text] = existing_embedding
+                self._norm_cache[existing_text] = existing_norm
+                cache_hits += 1
+                logger.debug(f"     Neo4j-Embedding für '{comp.name}'")
             else:
                 # Cache Miss - muss Embedding generieren
                 logger.debug(f"     Generiere Embedding für '{comp.name}'...")
-                existing_embedding = self.embeddings.embed_query(existing_text)
+                existing_embedding = self._embed(existing_text)
+                existing_norm = float(np.linalg.norm(existing_embedding))
                 self._embedding_cache[existing_text] = existing_embedding
+                self._norm_cache[existing_text] = existing_norm
                 api_calls_made += 1
+                
+                # Für künftige Läufe am Knoten speichern (überschreibt Embeddings alter Modelle)
+                comp.embedding = existing_embedding.tolist()
+                comp.embedding_model = EMBEDDING_MODEL
+                comp.save()
             
             # Berechne Similarity
-            similarity = self._cosine_similarity(new_embedding, existing_embedding)
+            similarity = self._cosine_similarity(new_embedding, existing_embedding,
+                                                 new_norm, existing_norm)
             logger.debug(f"     Similarity: {similarity:.3f}")
             
             if similarity > best_similarity:
                 best_similarity = similarity
                 best_match = comp
+            
+            # Erster Treffer über dem Schwellwert reicht für die Deduplikation -
+            # spart die restlichen Vergleiche (und ggf. Embedding-API-Calls)
+            if similarity >= similarity_threshold:
+                break
         
         if existing_comps:
             logger.info(f"   Embedding-Stats: {api_calls_made} API Calls, {cache_hits} Cache Hits")
@@ -202,9 +251,14 @@ class GraphIngestion:
             "level": level,
             "keywords": keywords or []
         })[0]
+        comp.embedding = new_embedding.tolist()
+        comp.embedding_model = EMBEDDING_MODEL
+        comp.save()
+        self.db.bump_competency_version()
         
         # WICHTIG: Füge das neue Embedding zum Cache hinzu für zukünftige Vergleiche!
         self._embedding_cache[name] = new_embedding
+        self._norm_cache[name] = new_norm
         
         logger.info(f" Neue Kompetenz erstellt: {name}")
         logger.debug(f" create_or_get_similar_competency ENDE")
@@ -216,19 +270,42 @@ class GraphIngestion:
                                    comp: Competency,
                                    confidence: float = 1.0):
         
-        # Prüfe ob Beziehung bereits existiert
-        existing = doc.teaches.relationship(comp)
-        if existing:
-            # Update Konfidenz wenn nötig
-            existing.confidence = confidence
-            existing.save()
-            logger.info(f"Aktualisiert: {doc.doc_id} -> lehrt -> {comp.name} (Konfidenz: {confidence})")
-        else:
-            # Neue Beziehung
-            rel = doc.teaches.connect(comp)
-            rel.confidence = confidence
-            rel.save()
-            logger.info(f"Verknüpft: {doc.doc_id} -> lehrt -> {comp.name} (Konfidenz: {confidence})")
+        self.link_documents_to_competencies([(doc.doc_id, comp.name, confidence)])
+    
+    def link_documents_to_competencies(self, pairs: List[Tuple[str, str, float]]) -> int:
+        """
+        Verknüpft Dokumente und Kompetenzen in Batches per UNWIND.
+        
+        MERGE prüft die Existenz der Beziehung serverseitig, bestehende
+        Beziehungen bekommen nur die neue Konfidenz.
+        
+        Args:
+            pairs: Liste von (doc_id, competency_name, confidence)
+            
+        Returns:
+            Anzahl verknüpfter Beziehungen
+        """
+        query = """
+        UNWIND $rows AS r
+        MATCH (d:Document {doc_id: r.doc})
+        MATCH (c:Competency {name: r.comp})
+        MERGE (d)-[rel:TEACHES]->(c)
+        ON CREATE SET rel.extracted_at = timestamp() / 1000.0
+        SET rel.confidence = r.conf
+        RETURN count(rel) as linked
+        """
+        
+        linked = 0
+        for i in range(0, len(pairs), self.LINK_BATCH_SIZE):
+            rows = [
+                {"doc": doc_id, "comp": comp_name, "conf": confidence}
+                for doc_id, comp_name, confidence in pairs[i:i + self.LINK_BATCH_SIZE]
+            ]
+            results, _ = self.db.execute_query(query, {"rows": rows})
+            linked += results[0][0] if results else 0
+        
+        logger.info(f"Verknüpft: {linked}/{len(pairs)} Dokument -> lehrt -> Kompetenz Beziehungen")
+        return linked
     
     def create_document_similarity(self, 
                                   doc1: Document, 
@@ -1,24 +1,26 @@
-from typing import List, Dict, Any, Optional, Tuple
+import atexit
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterator, NamedTuple, Optional, Tuple
 from .models import Document, Competency, Exercise
 from .neo4j_client import GraphDatabase
 from logger import get_logger
 
 logger = get_logger(__name__)
 
-
-class GraphQueries:
-    def __init__(self):
-        self.db = GraphDatabase()
-    
-    def find_related_documents(self, 
-                             doc_id: str, 
-                             max_distance: int = 2) -> List[Dict[str, Any]]:
-        
-        # Neo4j erlaubt keine Parameter in variable-length patterns
-        # Wir müssen die Query dynamisch bauen
-        query = f"""
-        MATCH (start:Document {{doc_id: $doc_id}})
-        MATCH path = (start)-[*1..{max_distance}]-(related:Document)
+# Neo4j erlaubt keine Parameter in variable-length patterns, daher wird die
+# Tiefe eingesetzt. Start per Index-Seek verankern, damit der Planner die
+# Expansion nicht von der anderen Seite beginnt. Die Expansion bleibt
+# untypisiert: Dokumente hängen über viele Knotentypen zusammen (Übungen,
+# Lernziele, Kompetenz-Beziehungen, ...), ein Typ-Filter würde Pfade verlieren.
+_RELATED_TEMPLATE = """
+        MATCH (start:Document {doc_id: $doc_id})
+        USING INDEX start:Document(doc_id)
+        WITH start LIMIT 1
+        MATCH path = (start)-[*1..__DEPTH__]-(related:Document)
         WHERE related.doc_id <> start.doc_id
         WITH related, min(length(path)) as distance
         RETURN DISTINCT 
@@ -29,168 +31,443 @@ class GraphQueries:
         ORDER BY distance, related.doc_id
         LIMIT 20
         """
-        
-        results, _ = self.db.execute_query(query, {
-            "doc_id": doc_id
-        })
-        
-        return [
-            {
-                "doc_id": row[0],
-                "title": row[1],
-                "type": row[2],
-                "distance": row[3]
-            }
-            for row in results
-        ]
-    
-    def find_competencies_for_document(self, doc_id: str) -> List[Dict[str, Any]]:
-        
-        query = """
-        MATCH (d:Document {doc_id: $doc_id})-[r:TEACHES]->(c:Competency)
+
+
+# Query-Strings als Modul-Konstanten: einmal angelegt, pro Aufruf nur referenziert
+_Q_RELATED_APOC = """
+        MATCH (start:Document {doc_id: $doc_id})
+        CALL apoc.path.expandConfig(start, {
+            labelFilter: ">Document",
+            minLevel: 1,
+            maxLevel: $max_distance,
+            uniqueness: "NODE_GLOBAL",
+            bfs: true
+        }) YIELD path
+        WITH last(nodes(path)) as related, length(path) as distance
+        WHERE related.doc_id <> $doc_id
         RETURN 
+            related.doc_id as doc_id,
+            related.title as title,
+            related.doc_type as type,
+            distance
+        ORDER BY distance, related.doc_id
+        LIMIT 20
+        """
+
+_Q_COMPETENCIES_FOR_DOCS = """
+        UNWIND $doc_ids AS did
+        MATCH (d:Document {doc_id: did})-[r:TEACHES]->(c:Competency)
+        RETURN 
+            did,
             c.name as name,
             c.description as description,
             c.level as level,
             r.confidence as confidence
+        ORDER BY did, r.confidence DESC
+        """
+
+_Q_LEARNING_PATH = """
+        MATCH path = shortestPath(
+            (start:Competency {name: $start})-[:PREREQUISITE_OF*]-(target:Competency {name: $target})
+        )
+        RETURN [node IN nodes(path) | node.name] as path
+        """
+
+_Q_GDS_DROP = "CALL gds.graph.drop($name, false) YIELD graphName RETURN graphName"
+
+_Q_GDS_PROJECT = """
+        CALL gds.graph.project($name, 'Competency', {
+            PREREQUISITE_OF: {orientation: 'UNDIRECTED'}
+        }) YIELD graphName
+        RETURN graphName
+        """
+
+_Q_LEARNING_PATH_GDS = """
+        MATCH (s:Competency {name: $start}), (t:Competency {name: $target})
+        CALL gds.shortestPath.dijkstra.stream($graph, {sourceNode: s, targetNode: t})
+        YIELD nodeIds
+        RETURN [id IN nodeIds | gds.util.asNode(id).name] AS path
+        """
+
+_Q_COMPETENCY_COVERAGE = """
+        MATCH (d:Document)-[r:TEACHES]->(c:Competency)
+        WHERE d.doc_id IN $doc_ids
+        WITH c.name as competency, avg(r.confidence) as avg_confidence
+        RETURN competency, avg_confidence
+        ORDER BY avg_confidence DESC
+        """
+
+_Q_DOCUMENTS_FOR_COMPETENCY = """
+        MATCH (c:Competency {name: $comp_name})<-[r:TEACHES]-(d:Document)
+        WHERE r.confidence >= $min_conf
+        RETURN 
+            d.doc_id as doc_id,
+            d.title as title,
+            d.lecture_name as lecture,
+            r.confidence as confidence
         ORDER BY r.confidence DESC
         """
+
+# Jede Subquery liefert genau eine Zeile, statt prev × next × Kompetenzen ×
+# Vorlesung auszumultiplizieren und erst danach zu aggregieren.
+_Q_DOCUMENT_CONTEXTS = """
+        UNWIND $doc_ids AS did
+        MATCH (d:Document {doc_id: did})
+        CALL { WITH d OPTIONAL MATCH (d)-[:FOLLOWS]->(n:Document) RETURN n.doc_id AS next_doc LIMIT 1 }
+        CALL { WITH d OPTIONAL MATCH (p:Document)-[:FOLLOWS]->(d) RETURN p.doc_id AS prev_doc LIMIT 1 }
+        CALL { WITH d OPTIONAL MATCH (d)-[:PART_OF]->(l:Lecture) RETURN l.name AS lecture LIMIT 1 }
+        CALL { WITH d OPTIONAL MATCH (d)-[:TEACHES]->(c:Competency) RETURN collect(DISTINCT c.name) AS comps }
+        RETURN 
+            did,
+            d.title as title,
+            d.content as content,
+            prev_doc,
+            next_doc,
+            lecture,
+            comps as competencies
+        """
+
+# Vom kleinen Kompetenz-Set aus starten (Index-Seek auf Competency.name),
+# statt alle Exercise-Competency-Paare zu expandieren und dann zu filtern
+_Q_SIMILAR_EXERCISES = """
+        UNWIND $competencies AS comp_name
+        MATCH (c:Competency {name: comp_name})
+        WITH DISTINCT c
+        MATCH (c)<-[:TRAINS]-(e:Exercise)
+        WITH e, count(c) as matching_comps
+        RETURN 
+            e.exercise_id as id,
+            e.title as title,
+            e.difficulty as difficulty,
+            matching_comps
+        ORDER BY matching_comps DESC, e.difficulty
+        LIMIT $limit
+        """
+
+
+# Ergebniszeilen: Tupel statt Dict pro Zeile (kein Key-Hashing, halber
+# Speicher). Bei Bedarf liefert `_asdict()` das frühere Dict-Format.
+class RelatedDocument(NamedTuple):
+    doc_id: str
+    title: str
+    type: str
+    distance: int
+
+
+class TaughtCompetency(NamedTuple):
+    name: str
+    description: str
+    level: str
+    confidence: float
+
+
+class CompetencyDocument(NamedTuple):
+    doc_id: str
+    title: str
+    lecture: str
+    confidence: float
+
+
+class SimilarExercise(NamedTuple):
+    id: str
+    title: str
+    difficulty: str
+    matching_competencies: int
+
+
+def _freeze(value: Any) -> Any:
+    """Macht Listen-Argumente hashbar (Reihenfolge egal, z.B. doc_ids)."""
+    if isinstance(value, (list, set, tuple)):
+        return frozenset(value)
+    return value
+
+
+def cached(ttl: float = 60.0):
+    """
+    LRU+TTL-Cache für GraphQueries-Methoden, Key = (Methode, Argumente).
+    Ergebnisse werden geteilt - Aufrufer dürfen sie nicht verändern.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            key = (
+                fn.__name__,
+                tuple(_freeze(a) for a in args),
+                tuple(sorted((k, _freeze(v)) for k, v in kwargs.items()))
+            )
+            now = time.monotonic()
+            
+            with self._cache_lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry[0] > now:
+                    self._cache.move_to_end(key)
+                    return entry[1]
+            
+            result = fn(self, *args, **kwargs)
+            
+            with self._cache_lock:
+                self._cache[key] = (now + ttl, result)
+                self._cache.move_to_end(key)
+                if len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last=False)
+            return result
+        return wrapper
+    return decorator
+
+
+class GraphQueries:
+    CACHE_SIZE = 1024
+    # Präfix der GDS-Projektion. GDS-Graphen sind serverweit, daher hängt
+    # _gds_graph die pid an: kein anderer Prozess droppt die Projektion,
+    # während hier darauf gerechnet wird
+    GDS_GRAPH = "comp_graph"
+    # Stand der Projektion, geteilt von allen Instanzen des Prozesses
+    _gds_version: Optional[int] = None  # competency_version der Projektion
+    _gds_lock = threading.Lock()
+    _gds_drop_registered = False
+    
+    def __init__(self):
+        self.db = GraphDatabase()
+        # Stellt den Index auf Document.doc_id sicher (für USING INDEX);
+        # läuft nur beim ersten Aufruf im Prozess
+        self.db.create_constraints()
+        self._has_apoc: Optional[bool] = None  # Wird beim ersten Aufruf ermittelt
+        self._has_gds: Optional[bool] = None
+        # Eine vorgebundene Funktion pro Tiefe: Query-String steht fest,
+        # pro Aufruf bleibt nur das Parameter-Dict
+        self._related_by_depth = {d: self._make_related(d) for d in (1, 2, 3, 4)}
+        self._cache: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    def invalidate(self, doc_id: Optional[str] = None):
+        """
+        Verwirft gecachte Query-Ergebnisse.
+        
+        Args:
+            doc_id: Nur Einträge entfernen, deren Argumente dieses Dokument
+                    enthalten. None = kompletten Cache leeren.
+        """
+        with self._cache_lock:
+            if doc_id is None:
+                self._cache.clear()
+                return
+            
+            def mentions(value):
+                return value == doc_id or (isinstance(value, frozenset) and doc_id in value)
+            
+            stale = [
+                key for key in self._cache
+                if any(mentions(a) for a in key[1]) or any(mentions(v) for _, v in key[2])
+            ]
+            for key in stale:
+                del self._cache[key]
+    
+    @cached()
+    def find_related_documents(self, 
+                             doc_id: str, 
+                             max_distance: int = 2) -> List[RelatedDocument]:
+        
+        if self._has_apoc is not False:
+            try:
+                results = self._related_documents_apoc(doc_id, max_distance)
+                self._has_apoc = True
+            except Exception as e:
+                if self._has_apoc or "apoc" not in str(e).lower():
+                    raise
+                logger.info("APOC nicht verfügbar - nutze Cypher var-length Fallback")
+                self._has_apoc = False
+        
+        if self._has_apoc is False:
+            results = self._related_documents_cypher(doc_id, max_distance)
+        
+        return [RelatedDocument(*row) for row in results]
+    
+    def _related_documents_apoc(self, doc_id: str, max_distance: int) -> list:
+        """
+        BFS mit NODE_GLOBAL-Uniqueness: jeder Knoten wird genau einmal auf
+        seiner kürzesten Tiefe besucht, statt alle Pfade aufzuzählen.
+        """
+        results = self.db.read_query(_Q_RELATED_APOC, {
+            "doc_id": doc_id,
+            "max_distance": max_distance
+        })
+        return results
+    
+    def _make_related(self, max_distance: int):
+        """Spezialisiert die var-length Query auf eine feste Tiefe."""
+        # Gleicher Query-String pro Tiefe -> Plan-Cache-Hit in Neo4j
+        query = _RELATED_TEMPLATE.replace("__DEPTH__", str(max_distance))
+        read_query = self.db.read_query
+        
+        def related(doc_id: str) -> list:
+            return read_query(query, {"doc_id": doc_id})
+        
+        return related
+    
+    def _related_documents_cypher(self, doc_id: str, max_distance: int) -> list:
+        
+        related = self._related_by_depth.get(max_distance)
+        if related is None:
+            related = self._make_related(max_distance)
+        
+        return related(doc_id)
+    
+    def find_competencies_for_document(self, doc_id: str) -> List[TaughtCompetency]:
+        
+        return self.find_competencies_for_documents([doc_id])[doc_id]
+    
+    @cached()
+    def find_competencies_for_documents(self, doc_ids: List[str]) -> Dict[str, List[TaughtCompetency]]:
+        """
+        Kompetenzen für mehrere Dokumente in einem Round-Trip.
         
-        results, _ = self.db.execute_query(query, {"doc_id": doc_id})
+        Returns:
+            Dict doc_id -> Liste der Kompetenzen (leer wenn keine vorhanden)
+        """
         
-        return [
-            {
-                "name": row[0],
-                "description": row[1],
-                "level": row[2],
-                "confidence": row[3]
-            }
-            for row in results
-        ]
+        results = self.db.read_query(_Q_COMPETENCIES_FOR_DOCS, {"doc_ids": list(doc_ids)})
+        
+        competencies = {doc_id: [] for doc_id in doc_ids}
+        for row in results:
+            competencies[row[0]].append(TaughtCompetency(*row[1:]))
+        return competencies
     
+    @cached()
     def find_learning_path(self, 
                           start_competency: str, 
                           target_competency: str) -> Optional[List[str]]:
         
-        query = """
-        MATCH path = shortestPath(
-            (start:Competency {name: $start})-[:PREREQUISITE_OF*]-(target:Competency {name: $target})
-        )
-        RETURN [node IN nodes(path) | node.name] as path
-        """
+        if self._has_gds is not False:
+            try:
+                path = self._learning_path_gds(start_competency, target_competency)
+                self._has_gds = True
+                return path
+            except Exception as e:
+                if self._has_gds:
+                    # Projektion fehlt oder wurde ersetzt: diesmal Cypher,
+                    # beim nächsten Aufruf neu projizieren
+                    logger.warning(f"GDS-Pfadsuche fehlgeschlagen, nutze Cypher: {e}")
+                    GraphQueries._gds_version = None
+                elif "gds" not in str(e).lower():
+                    raise
+                else:
+                    logger.info("GDS nicht verfügbar - nutze Cypher shortestPath Fallback")
+                    self._has_gds = False
         
-        results, _ = self.db.execute_query(query, {
+        results = self.db.read_query(_Q_LEARNING_PATH, {
             "start": start_competency,
             "target": target_competency
         })
         
         return results[0][0] if results else None
     
-    def get_competency_coverage(self, doc_ids: List[str]) -> Dict[str, float]:
-        
-        query = """
-        MATCH (d:Document)-[r:TEACHES]->(c:Competency)
-        WHERE d.doc_id IN $doc_ids
-        WITH c.name as competency, avg(r.confidence) as avg_confidence
-        RETURN competency, avg_confidence
-        ORDER BY avg_confidence DESC
+    def _ensure_gds_graph(self):
+        """
+        Projiziert den Kompetenz-Graph in den GDS-Speicher. Die Projektion
+        bleibt bestehen, bis ein Schreiber die competency_version erhöht.
         """
+        with GraphQueries._gds_lock:
+            version = self.db.competency_version
+            if GraphQueries._gds_version == version:
+                return
+            
+            self.db.execute_query(_Q_GDS_DROP, {"name": self._gds_graph})
+            self.db.execute_query(_Q_GDS_PROJECT, {"name": self._gds_graph})
+            GraphQueries._gds_version = version
+            logger.debug(f"GDS-Projektion '{self._gds_graph}' erstellt (Version {version})")
+            
+            # Prozess-eigene Projektion beim Beenden wieder freigeben
+            if not GraphQueries._gds_drop_registered:
+                atexit.register(self._drop_gds_graph)
+                GraphQueries._gds_drop_registered = True
+    
+    @property
+    def _gds_graph(self) -> str:
+        # pid zur Laufzeit, damit auch geforkte Prozesse eigene Namen haben
+        return f"{self.GDS_GRAPH}_{os.getpid()}"
+    
+    def _drop_gds_graph(self):
+        try:
+            self.db.execute_query(_Q_GDS_DROP, {"name": self._gds_graph})
+        except Exception as e:
+            logger.debug(f"GDS-Projektion '{self._gds_graph}' nicht entfernt: {e}")
+    
+    def _learning_path_gds(self, start_competency: str, target_competency: str) -> Optional[List[str]]:
+        self._ensure_gds_graph()
+        
+        results = self.db.read_query(_Q_LEARNING_PATH_GDS, {
+            "start": start_competency,
+            "target": target_competency,
+            "graph": self._gds_graph
+        })
+        
+        return results[0][0] if results else None
+    
+    @cached()
+    def get_competency_coverage(self, doc_ids: List[str]) -> Dict[str, float]:
         
-        results, _ = self.db.execute_query(query, {"doc_ids": doc_ids})
+        rows = self.db.execute_query_stream(_Q_COMPETENCY_COVERAGE, {"doc_ids": list(doc_ids)})
         
-        return {row[0]: row[1] for row in results}
+        return {row["competency"]: row["avg_confidence"] for row in rows}
     
+    @cached()
     def find_documents_for_competency(self, 
                                     competency_name: str,
-                                    min_confidence: float = 0.5) -> List[Dict[str, Any]]:
+                                    min_confidence: float = 0.5) -> List[CompetencyDocument]:
         
-        query = """
-        MATCH (c:Competency {name: $comp_name})<-[r:TEACHES]-(d:Document)
-        WHERE r.confidence >= $min_conf
-        RETURN 
-            d.doc_id as doc_id,
-            d.title as title,
-            d.lecture_name as lecture,
-            r.confidence as confidence
-        ORDER BY r.confidence DESC
+        return list(self.iter_documents_for_competency(competency_name, min_confidence))
+    
+    def iter_documents_for_competency(self, 
+                                      competency_name: str,
+                                      min_confidence: float = 0.5) -> Iterator[CompetencyDocument]:
+        """
+        Wie find_documents_for_competency, aber lazy und ungecacht -
+        für Schleifen, die nur die besten k Dokumente brauchen.
         """
         
-        results, _ = self.db.execute_query(query, {
+        rows = self.db.execute_query_stream(_Q_DOCUMENTS_FOR_COMPETENCY, {
             "comp_name": competency_name,
             "min_conf": min_confidence
         })
-        
-        return [
-            {
-                "doc_id": row[0],
-                "title": row[1],
-                "lecture": row[2],
-                "confidence": row[3]
-            }
-            for row in results
-        ]
+        return (CompetencyDocument(**row) for row in rows)
     
     def get_document_context(self, doc_id: str) -> Dict[str, Any]:
         
-        # Hole Dokument mit allen relevanten Beziehungen
-        query = """
-        MATCH (d:Document {doc_id: $doc_id})
-        OPTIONAL MATCH (d)-[:FOLLOWS]->(next:Document)
-        OPTIONAL MATCH (prev:Document)-[:FOLLOWS]->(d)
-        OPTIONAL MATCH (d)-[:TEACHES]->(c:Competency)
-        OPTIONAL MATCH (d)-[:PART_OF]->(l:Lecture)
-        RETURN 
-            d.title as title,
-            d.content as content,
-            prev.doc_id as prev_doc,
-            next.doc_id as next_doc,
-            l.name as lecture,
-            collect(DISTINCT c.name) as competencies
+        return self.get_document_contexts([doc_id]).get(doc_id, {})
+    
+    @cached()
+    def get_document_contexts(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
         """
+        Kontext (Nachbarfolien, Vorlesung, Kompetenzen) für mehrere Dokumente
+        in einem Round-Trip.
         
-        results, _ = self.db.execute_query(query, {"doc_id": doc_id})
+        Returns:
+            Dict doc_id -> Kontext; nicht gefundene Dokumente fehlen
+        """
         
-        if not results:
-            return {}
+        results = self.db.read_query(_Q_DOCUMENT_CONTEXTS, {"doc_ids": list(doc_ids)})
         
-        row = results[0]
-        return {
-            "title": row[0],
-            "content": row[1],
-            "previous": row[2],
-            "next": row[3],
-            "lecture": row[4],
-            "competencies": row[5]
-        }
+        contexts = {}
+        for row in results:
+            # Doppelte doc_ids in der Eingabe liefern dieselbe Zeile mehrfach
+            contexts.setdefault(row[0], {
+                "title": row[1],
+                "content": row[2],
+                "previous": row[3],
+                "next": row[4],
+                "lecture": row[5],
+                "competencies": row[6]
+            })
+        return contexts
     
+    @cached()
     def find_similar_exercises(self, 
                              competencies: List[str],
-                             limit: int = 5) -> List[Dict[str, Any]]:
+                             limit: int = 5) -> List[SimilarExercise]:
         
-        query = """
-        MATCH (c:Competency)<-[:TRAINS]-(e:Exercise)
-        WHERE c.name IN $competencies
-        WITH e, count(DISTINCT c) as matching_comps
-        RETURN 
-            e.exercise_id as id,
-            e.title as title,
-            e.difficulty as difficulty,
-            matching_comps
-        ORDER BY matching_comps DESC, e.difficulty
-        LIMIT $limit
-        """
-        
-        results, _ = self.db.execute_query(query, {
+        results = self.db.read_query(_Q_SIMILAR_EXERCISES, {
             "competencies": competencies,
             "limit": limit
         })
         
-        return [
-            {
-                "id": row[0],
-                "title": row[1],
-                "difficulty": row[2],
-                "matching_competencies": row[3]
-            }
-            for row in results
-        ]
+        return [SimilarExercise(*row) for row in results]
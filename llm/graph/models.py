@@ -83,6 +83,8 @@ class Competency(StructuredNode):
         "analyze": "analyze", "evaluate": "evaluate", "create": "create"
     })
     keywords = ArrayProperty(StringProperty())
+    embedding = ArrayProperty(FloatProperty())  # Name-Embedding für Deduplikation
+    embedding_model = StringProperty()  # Modell, das `embedding` erzeugt hat
     
     # Beziehungen
     taught_by = RelationshipFrom("Document", "TEACHES", model=TeachesRel)
@@ -2,13 +2,28 @@
 Moodle REST API Client - Low-level wrapper
 Keeps it simple and focused on API communication only
 """
+import asyncio
+import gzip
+import io
+import os
+import httpx
+import ijson
+import orjson
 import requests
-from typing import Dict, Any, Optional
+from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlencode
 from logger import get_logger
 
 logger = get_logger(__name__)
 
 
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+GZIP_FORM_HEADERS = {**FORM_HEADERS, 'Content-Encoding': 'gzip'}
+
+
 class MoodleClient:
     """
     Low-level Moodle REST API client.
@@ -17,17 +32,52 @@ class MoodleClient:
     Does NOT implement business logic - that's for other modules.
     """
     
-    def __init__(self, url: str, token: str):
+    # Above this many flattened keys the body is urlencoded directly from
+    # the (key, value) list instead of going through a dict
+    LARGE_PAYLOAD_KEYS = 1000
+    # Bodies above this size are gzipped when MOODLE_GZIP_REQUESTS is on
+    GZIP_MIN_BYTES = 4096
+    
+    def __init__(self, url: str, token: str, timeout: float = 60.0):
         """
         Initialize Moodle client.
         
         Args:
             url: Moodle site URL (e.g. 'https://moodle.example.com')
             token: Web service token
+            timeout: Per-request timeout in seconds
         """
         self.url = url.rstrip('/')
         self.token = token
+        self.timeout = timeout
         self.rest_url = f"{self.url}/webservice/rest/server.php"
+        # Identical for every call - built once
+        self._base_params = {'wstoken': self.token, 'moodlewsrestformat': 'json'}
+        # Opt-in: the web server must decompress request bodies
+        # (e.g. Apache mod_deflate as input filter), PHP does not
+        self.gzip_requests = os.getenv("MOODLE_GZIP_REQUESTS", "false").lower() == "true"
+        
+        # Persistent session: keep-alive + connection pool instead of a new
+        # TCP/TLS handshake per call. Retries only cover failed connects:
+        # every WS call is a POST and write functions must not run twice.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.3)
+        )
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+    
+    def close(self):
+        """Release pooled connections."""
+        self._session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
         
     def _flatten_params(self, params: Dict[str, Any], prefix: str = '') -> Dict[str, Any]:
         """
@@ -36,29 +86,40 @@ class MoodleClient:
         Moodle expects arrays as: param[index][key]=value
         And nested objects as: param[key]=value
         """
-        flattened = {}
+        return dict(self._flatten_items(params, prefix))
+    
+    def _flatten_items(self, params: Dict[str, Any], prefix: str = '') -> List[Tuple[str, Any]]:
+        """
+        Same as _flatten_params, but returns (key, value) pairs in order.
+        
+        Iterative with an explicit stack (no recursion, one output list).
+        Children are pushed in reverse so keys keep their original order.
+        """
+        flattened = []
+        stack = deque([(prefix, params)])
         
-        for key, value in params.items():
-            full_key = f"{prefix}[{key}]" if prefix else key
+        while stack:
+            key, value = stack.pop()
             
             if isinstance(value, dict):
-                # Nested dict - recursively flatten
-                flattened.update(self._flatten_params(value, full_key))
+                items = [
+                    (f"{key}[{k}]" if key else k, v)
+                    for k, v in value.items()
+                ]
+                stack.extend(reversed(items))
             elif isinstance(value, list):
-                # Array - use index notation
-                if len(value) == 0:
+                if not value:
                     # Empty array Moodle needs to know it's an array even if empty
                     # Use special notation for empty arrays
-                    flattened[f"{full_key}[0]"] = ''
+                    flattened.append((f"{key}[0]", ''))
                 else:
-                    for i, item in enumerate(value):
-                        if isinstance(item, dict):
-                            flattened.update(self._flatten_params(item, f"{full_key}[{i}]"))
-                        else:
-                            flattened[f"{full_key}[{i}]"] = item
+                    stack.extend(
+                        (f"{key}[{i}]", item)
+                        for i, item in reversed(list(enumerate(value)))
+                    )
             else:
                 # Simple value
-                flattened[full_key] = value
+                flattened.append((key, value))
                 
         return flattened
     
@@ -76,29 +137,150 @@ class MoodleClient:
         Raises:
             requests.HTTPError: On API errors
         """
-        # Flatten nested parameters for Moodle's expected format
-        flattened_params = self._flatten_params(params)
-        
-        data = {
-            'wstoken': self.token,
-            'wsfunction': function_name,
-            'moodlewsrestformat': 'json',
-            **flattened_params
-        }
+        data, headers = self._encode_body(function_name, params)
         
         logger.debug(f"Calling Moodle function: {function_name}")
         
-        response = requests.post(self.rest_url, data=data)
+        response = self._session.post(self.rest_url, data=data, headers=headers,
+                                      timeout=self.timeout)
         response.raise_for_status()
         
-        result = response.json()
+        return self._check_result(orjson.loads(response.content))
+    
+    def iter_function_items(self, function_name: str, prefix: str, **params) -> Iterator[Any]:
+        """
+        Call a Moodle function that returns a JSON list and stream-parse it.
+        
+        Yields the objects found at `prefix` (ijson syntax, e.g.
+        'item.modules.item') while the response is still being read, so
+        the full result is never materialized.
+        
+        Args:
+            function_name: Moodle function name
+            prefix: ijson prefix of the objects to yield
+            **params: Function parameters
+            
+        Raises:
+            requests.HTTPError: On API errors
+        """
+        data, headers = self._encode_body(function_name, params)
+        
+        logger.debug(f"Calling Moodle function (streamed): {function_name}")
+        
+        with self._session.post(self.rest_url, data=data, headers=headers,
+                                timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            body = io.BufferedReader(response.raw)
+            
+            # List results start with '['; an object is a Moodle error
+            if body.peek(1)[:1] != b'[':
+                self._check_result(orjson.loads(body.read()))
+                return
+            
+            yield from ijson.items(body, prefix, use_float=True)
+    
+    def _build_data(self, function_name: str, params: Dict[str, Any]) -> Union[Dict[str, Any], str]:
+        """
+        Build the POST body for a web service call.
         
+        Returns a dict for normal calls. Large payloads (bulk creates) come
+        back already urlencoded, built straight from the flattened pairs.
+        """
+        # Flatten nested parameters for Moodle's expected format
+        flattened = self._flatten_items(params)
+        
+        if len(flattened) > self.LARGE_PAYLOAD_KEYS:
+            items = [*self._base_params.items(), ('wsfunction', function_name)]
+            # requests drops None values when encoding - do the same
+            items.extend((k, v) for k, v in flattened if v is not None)
+            return urlencode(items)
+        
+        data = {**self._base_params, 'wsfunction': function_name}
+        data.update(flattened)
+        return data
+    
+    def _encode_body(self, function_name: str,
+                     params: Dict[str, Any]) -> Tuple[Union[Dict[str, Any], str, bytes], Optional[Dict[str, str]]]:
+        """
+        Build the POST body plus the headers it needs.
+        
+        Dicts are left to the HTTP library to encode. Encoded bodies above
+        GZIP_MIN_BYTES are gzipped if gzip_requests is enabled.
+        """
+        data = self._build_data(function_name, params)
+        
+        if isinstance(data, dict):
+            if not self.gzip_requests:
+                return data, None
+            data = self._urlencode(data)
+        
+        if self.gzip_requests and len(data) > self.GZIP_MIN_BYTES:
+            return gzip.compress(data.encode()), GZIP_FORM_HEADERS
+        
+        return data, FORM_HEADERS
+    
+    @staticmethod
+    def _urlencode(data: Dict[str, Any]) -> str:
+        """Form-encode a body dict the way requests does (None values dropped)."""
+        return urlencode([(k, v) for k, v in data.items() if v is not None])
+    
+    @staticmethod
+    def _check_result(result: Any) -> Any:
+        """Raise on Moodle error payloads, otherwise pass the result through."""
         # Check for Moodle errors
         if isinstance(result, dict) and 'exception' in result:
             raise Exception(f"Moodle error: {result['message']}")
             
         return result
     
+    async def _call(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore,
+                    function_name: str, params: Dict[str, Any]) -> Any:
+        """Single async web service call, bounded by the shared semaphore."""
+        data, headers = self._encode_body(function_name, params)
+        # Encode dicts ourselves: httpx would send None as 'key=' instead of
+        # dropping it like the requests path does
+        if isinstance(data, dict):
+            data, headers = self._urlencode(data), FORM_HEADERS
+        
+        async with semaphore:
+            logger.debug(f"Calling Moodle function (async): {function_name}")
+            response = await client.post(self.rest_url, content=data, headers=headers)
+        response.raise_for_status()
+        
+        return self._check_result(orjson.loads(response.content))
+    
+    async def call_functions_async(self, calls: List[Tuple[str, Dict[str, Any]]],
+                                   max_concurrency: int = 8) -> List[Any]:
+        """
+        Call several Moodle web service functions concurrently.
+        
+        Args:
+            calls: List of (function_name, params) tuples
+            max_concurrency: Maximum number of requests in flight
+            
+        Returns:
+            Results in the same order as `calls`
+            
+        Raises:
+            httpx.HTTPStatusError: On API errors (first failing call)
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        limits = httpx.Limits(max_connections=max_concurrency,
+                              max_keepalive_connections=max_concurrency)
+        
+        # HTTP/2: concurrent calls multiplex over one TLS connection
+        async with httpx.AsyncClient(http2=True, limits=limits, timeout=self.timeout) as client:
+            return await asyncio.gather(*[
+                self._call(client, semaphore, function_name, params)
+                for function_name, params in calls
+            ])
+    
+    def call_functions_parallel(self, calls: List[Tuple[str, Dict[str, Any]]],
+                                max_concurrency: int = 8) -> List[Any]:
+        """Synchronous wrapper around call_functions_async()."""
+        return asyncio.run(self.call_functions_async(calls, max_concurrency))
+    
     def upload_file(self, file_path: str, component: str = 'user', 
                    filearea: str = 'draft', itemid: int = 0) -> str:
         """
@@ -3,15 +3,110 @@ Moodle Competency Framework Uploader
 Überträgt Kompetenzen aus Neo4j nach Moodle
 """
 
-from typing import Dict, List, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Tuple
 from .client import MoodleClient
 from llm.graph.neo4j_client import GraphDatabase
 from logger import get_logger
+import hashlib
 import json
+import os
+import requests
+import time
 from datetime import datetime
 
 logger = get_logger(__name__)
 
+CACHE_DIR = Path(".cache")
+
+# Query-Strings als Modul-Konstanten: Der Text muss zwischen Aufrufen
+# byte-identisch bleiben (keine f-Strings), sonst verfehlt Neo4j den Plan-Cache.
+_Q_FINGERPRINT = """
+        MATCH (d:Document)
+        WHERE d.lecture_name = $course_id
+        RETURN 
+            count(d) as docs,
+            sum(COUNT { (d)-[:TEACHES]->() }) as teaches,
+            sum(COUNT { (d)-[:BELONGS_TO]->() }) as clusters,
+            max(d.updated_at) as updated
+        """
+
+_Q_CLUSTERS = """
+        MATCH (tc:ThemeCluster)
+        OPTIONAL MATCH (tc)<-[:BELONGS_TO]-(d:Document {lecture_name: $course_id})-[:TEACHES]->(c:Competency)
+        RETURN 
+            tc.cluster_id as id,
+            tc.name as name,
+            tc.description as description,
+            collect(DISTINCT {
+                name: c.name,
+                description: c.description,
+                bloom_level: c.bloom_level
+            }) as comps
+        ORDER BY tc.name
+        """
+
+_Q_DIRECT_COMPETENCIES = """
+        MATCH (d:Document)-[:TEACHES]->(c:Competency)
+        WHERE d.lecture_name = $course_id
+        RETURN DISTINCT
+            c.name as name,
+            c.description as description,
+            c.bloom_level as bloom_level
+        ORDER BY c.name
+        """
+
+_Q_UPDATE_MOODLE_IDS = """
+        UNWIND $rows AS row
+        MATCH (c:Competency {name: row.name})
+        SET c.moodle_id = row.moodle_id
+        RETURN count(c) AS updated
+        """
+
+_Q_ASSIGNMENT_COMPETENCIES = """
+        MATCH (a:Assignment)-[:REQUIRES]->(c:Competency)
+        WHERE a.course_id = $course_id
+        RETURN a.name as assignment_name, collect(c.name) as competencies
+        """
+
+# Zeichen, die in generierten Kompetenz-idnumbers durch '_' ersetzt werden
+_IDNUM_TABLE = str.maketrans({' ': '_', '/': '_', '\\': '_', '\t': '_'})
+
+
+@dataclass(slots=True)
+class CompetencyBatch:
+    """
+    Kompetenz-Hierarchie als parallele Listen (Struct of Arrays) statt
+    einem Dict pro Cluster und Kompetenz.
+    
+    Kompetenz i gehört zum Cluster `comp_cluster_idx[i]`. `len()` liefert
+    die Anzahl der Cluster.
+    """
+    cluster_ids: List[str] = field(default_factory=list)
+    cluster_names: List[str] = field(default_factory=list)
+    cluster_descs: List[str] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)
+    descriptions: List[str] = field(default_factory=list)
+    bloom_levels: List[str] = field(default_factory=list)
+    comp_cluster_idx: List[int] = field(default_factory=list)
+    
+    def __len__(self) -> int:
+        return len(self.cluster_names)
+    
+    def add_cluster(self, cluster_id: str, name: str, description: str) -> int:
+        self.cluster_ids.append(cluster_id)
+        self.cluster_names.append(name)
+        self.cluster_descs.append(description)
+        return len(self.cluster_names) - 1
+    
+    def add_competency(self, cluster_idx: int, name: str, description: str, bloom_level: str):
+        self.names.append(name)
+        self.descriptions.append(description)
+        self.bloom_levels.append(bloom_level)
+        self.comp_cluster_idx.append(cluster_idx)
+
 
 class MoodleCompetencyUploader:
     """
@@ -26,11 +121,21 @@ class MoodleCompetencyUploader:
     6. Mappe Assignment-Kompetenzen
     """
     
+    # Max. Kompetenzen pro Bulk-Request (hält die POST-Bodies überschaubar)
+    BULK_CHUNK_SIZE = 100
+    # Parallele WS-Calls für unabhängige Einzelaufrufe (Moodle-Last begrenzen)
+    MAX_WORKERS = 8
+    # Gültigkeit gecachter core_course_get_contents-Ergebnisse (Sekunden)
+    COURSE_CONTENTS_TTL = 300
+    
     def __init__(self, moodle_client: MoodleClient):
         self.moodle = moodle_client
         self.db = GraphDatabase()
         self.framework_id = None
         self.competency_mapping = {}  # Neo4j name -> Moodle ID
+        self._site_functions = None  # Verfügbare WS-Funktionen (lazy)
+        self._course_contents = {}  # course_id -> (Zeitstempel, Assignments)
+        self._used_idnumbers = set()  # Moodle lehnt doppelte idnumbers im Framework ab
         
     def create_framework_for_course(self, course_shortname: str, course_fullname: str = None) -> int:
         """
@@ -66,6 +171,7 @@ class MoodleCompetencyUploader:
             )
             
             self.framework_id = response['id']
+            self._used_idnumbers.clear()
             logger.info(f" Competency Framework erstellt: ID={self.framework_id}, Name={response['shortname']}")
             return self.framework_id
             
@@ -73,92 +179,92 @@ class MoodleCompetencyUploader:
             logger.error(f" Fehler beim Erstellen des Frameworks: {e}")
             raise
             
-    def load_competencies_from_neo4j(self, course_shortname: str) -> Dict[str, Any]:
+    def load_competencies_from_neo4j(self, course_shortname: str) -> CompetencyBatch:
         """
         Lädt die Kompetenz-Hierarchie aus Neo4j.
         
+        Ergebnisse werden pro Kurs in .cache/ abgelegt und wiederverwendet,
+        solange die TTL (COMPETENCY_CACHE_TTL, Sekunden, 0 = aus) nicht
+        abgelaufen ist und sich der Neo4j-Fingerprint des Kurses nicht
+        geändert hat.
+        
         Returns:
-            Dict mit ThemeClusters und zugehörigen Kompetenzen
-        """
-        # 1. Hole ThemeCluster
-        cluster_query = """
-        MATCH (tc:ThemeCluster)
-        RETURN tc.cluster_id as id, tc.name as name, tc.description as description
-        ORDER BY tc.name
+            CompetencyBatch mit ThemeClusters und zugehörigen Kompetenzen
         """
+        ttl = float(os.getenv("COMPETENCY_CACHE_TTL", "3600"))
+        if ttl <= 0:
+            return self._query_competencies(course_shortname)
         
-        cluster_result = self.db.execute_query(cluster_query, {})
-        clusters_data, _ = cluster_result
+        cache_file = CACHE_DIR / f"{course_shortname.lower()}_competencies.json"
+        fingerprint = self._fingerprint(course_shortname)
         
-        clusters = {}
-        for row in clusters_data:
-            cluster_id, name, desc = row
-            clusters[name] = {
-                'id': cluster_id,
-                'name': name,
-                'description': desc or f"Themenbereich: {name}",
-                'competencies': []
-            }
+        if cache_file.exists():
+            try:
+                with open(cache_file, encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached['fp'] == fingerprint and time.time() - cached['ts'] < ttl:
+                    clusters = CompetencyBatch(**cached['clusters'])
+                    logger.info(f" Kompetenzen für {course_shortname} aus Cache geladen ({len(clusters)} Cluster)")
+                    return clusters
+            except Exception as e:
+                logger.warning(f" Kompetenz-Cache nicht lesbar: {e}")
         
-        # 2. Hole Kompetenzen pro Cluster
-        comp_query = """
-        MATCH (tc:ThemeCluster)<-[:BELONGS_TO]-(d:Document)
-        MATCH (d)-[:TEACHES]->(c:Competency)
-        WHERE d.lecture_name = $course_id
-        RETURN 
-            tc.name as cluster_name,
-            c.name as comp_name,
-            c.description as comp_desc,
-            c.bloom_level as bloom_level
-        ORDER BY tc.name, c.name
+        clusters = self._query_competencies(course_shortname)
+        
+        try:
+            CACHE_DIR.mkdir(exist_ok=True)
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump({'fp': fingerprint, 'ts': time.time(), 'clusters': asdict(clusters)}, f, ensure_ascii=False)
+        except Exception as e:
+            logger.warning(f" Kompetenz-Cache konnte nicht geschrieben werden: {e}")
+        
+        return clusters
+    
+    def _fingerprint(self, course_shortname: str) -> list:
+        """
+        Billiger Änderungs-Fingerprint eines Kurses: Anzahl Dokumente,
+        TEACHES-/BELONGS_TO-Kanten und letzte Änderung.
         """
         
-        comp_result = self.db.execute_query(comp_query, {'course_id': course_shortname.upper()})
-        comp_data, _ = comp_result
+        result, _ = self.db.execute_query(_Q_FINGERPRINT, {'course_id': course_shortname.upper()})
+        return list(result[0]) if result else []
+    
+    def _query_competencies(self, course_shortname: str) -> CompetencyBatch:
+        # ThemeCluster samt Kompetenzen des Kurses in einem Round-Trip
+        cluster_result = self.db.execute_query(_Q_CLUSTERS, {'course_id': course_shortname.upper()})
+        clusters_data, _ = cluster_result
         
-        for row in comp_data:
-            cluster_name, comp_name, comp_desc, bloom_level = row
-            if cluster_name in clusters:
-                clusters[cluster_name]['competencies'].append({
-                    'name': comp_name,
-                    'description': comp_desc or comp_name,
-                    'bloom_level': bloom_level or 'apply'
-                })
+        batch = CompetencyBatch()
+        for row in clusters_data:
+            cluster_id, name, desc, comps = row
+            idx = batch.add_cluster(cluster_id, name, desc or f"Themenbereich: {name}")
+            # Leere Cluster liefern einen Platzhalter mit name = null
+            comps = sorted((comp for comp in comps if comp['name'] is not None),
+                           key=lambda comp: comp['name'])
+            for comp in comps:
+                batch.add_competency(
+                    idx,
+                    comp['name'],
+                    comp['description'] or comp['name'],
+                    comp['bloom_level'] or 'apply'
+                )
         
         # Falls keine Cluster vorhanden, hole alle Kompetenzen direkt
-        if not clusters:
+        if not batch:
             logger.warning(" Keine ThemeCluster gefunden, lade Kompetenzen ohne Hierarchie")
-            direct_query = """
-            MATCH (d:Document)-[:TEACHES]->(c:Competency)
-            WHERE d.lecture_name = $course_id
-            RETURN DISTINCT
-                c.name as name,
-                c.description as description,
-                c.bloom_level as bloom_level
-            ORDER BY c.name
-            """
-            
-            direct_result = self.db.execute_query(direct_query, {'course_id': course_shortname.upper()})
+            
+            direct_result = self.db.execute_query(_Q_DIRECT_COMPETENCIES, {'course_id': course_shortname.upper()})
             direct_data, _ = direct_result
             
             # Erstelle einen Default-Cluster
-            clusters['Allgemeine Kompetenzen'] = {
-                'id': 'default',
-                'name': 'Allgemeine Kompetenzen',
-                'description': f'Kompetenzen für {course_shortname}',
-                'competencies': []
-            }
+            idx = batch.add_cluster('default', 'Allgemeine Kompetenzen', f'Kompetenzen für {course_shortname}')
             
             for row in direct_data:
                 name, desc, bloom = row
-                clusters['Allgemeine Kompetenzen']['competencies'].append({
-                    'name': name,
-                    'description': desc or name,
-                    'bloom_level': bloom or 'apply'
-                })
+                batch.add_competency(idx, name, desc or name, bloom or 'apply')
         
-        logger.info(f" Geladen: {len(clusters)} Cluster mit insgesamt {sum(len(c['competencies']) for c in clusters.values())} Kompetenzen")
-        return clusters
+        logger.info(f" Geladen: {len(batch)} Cluster mit insgesamt {len(batch.names)} Kompetenzen")
+        return batch
     
     def create_competency(self, name: str, description: str, parent_id: int = 0, 
                           idnumber: str = None) -> int:
@@ -177,18 +283,7 @@ class MoodleCompetencyUploader:
         if not self.framework_id:
             raise ValueError("Framework muss zuerst erstellt werden!")
             
-        if not idnumber:
-            # Generiere ID aus Name
-            idnumber = f"comp_{name[:50].lower().replace(' ', '_').replace('/', '_')}"
-            
-        comp_data = {
-            'competencyframeworkid': self.framework_id,
-            'shortname': name[:100],  # Moodle Limit
-            'idnumber': idnumber,
-            'description': description,
-            'parentid': parent_id
-            # sortorder und descriptionformat weglassen - Moodle nutzt Defaults
-        }
+        comp_data = self._competency_payload(name, description, parent_id, idnumber)
         
         try:
             # Moodle erwartet die Daten in einem 'competency' wrapper
@@ -200,19 +295,154 @@ class MoodleCompetencyUploader:
             comp_id = response['id']
             self.competency_mapping[name] = comp_id
             
-            logger.debug(f" Kompetenz erstellt: {name} (ID={comp_id}, Parent={parent_id})")
+            logger.debug(" Kompetenz erstellt: %s (ID=%s, Parent=%s)", name, comp_id, parent_id)
             return comp_id
             
         except Exception as e:
             logger.error(f" Fehler beim Erstellen der Kompetenz '{name}': {e}")
             raise
     
-    def upload_competency_hierarchy(self, clusters: Dict[str, Any]) -> Dict[str, int]:
+    def _competency_payload(self, name: str, description: str, parent_id: int = 0,
+                            idnumber: str = None) -> Dict[str, Any]:
+        """Baut die Moodle-Daten für eine Kompetenz."""
+        # Generiere ID aus Name
+        idnumber = idnumber or 'comp_' + name[:50].lower().translate(_IDNUM_TABLE)
+        
+        # Kollision (z.B. gleicher 50-Zeichen-Präfix) lokal auflösen statt
+        # einen fehlschlagenden WS-Call zu riskieren
+        if idnumber in self._used_idnumbers:
+            suffix = 2
+            while f"{idnumber}_{suffix}" in self._used_idnumbers:
+                suffix += 1
+            idnumber = f"{idnumber}_{suffix}"
+        self._used_idnumbers.add(idnumber)
+            
+        return {
+            'competencyframeworkid': self.framework_id,
+            'shortname': name[:100],  # Moodle Limit
+            'idnumber': idnumber,
+            'description': description,
+            'parentid': parent_id
+            # sortorder und descriptionformat weglassen - Moodle nutzt Defaults
+        }
+    
+    def _supports_function(self, function_name: str) -> bool:
+        """Prüft (einmalig per site_info), ob der Token eine WS-Funktion aufrufen darf."""
+        if self._site_functions is None:
+            try:
+                info = self.moodle.call_function('core_webservice_get_site_info')
+                self._site_functions = {f['name'] for f in info.get('functions', [])}
+            except Exception as e:
+                logger.warning(f" Site-Info nicht verfügbar, nutze Einzel-Calls: {e}")
+                self._site_functions = set()
+        return function_name in self._site_functions
+    
+    def _call_many(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[Any, Optional[Exception]]]:
+        """
+        Führt unabhängige WS-Calls parallel aus (I/O-bound, GIL wird freigegeben).
+        
+        Returns:
+            (Ergebnis, Exception) pro Call, in Reihenfolge der Eingabe
+        """
+        def run(call):
+            function_name, params = call
+            try:
+                return self.moodle.call_function(function_name, **params), None
+            except Exception as e:
+                return None, e
+        
+        if not calls:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(calls))) as pool:
+            return list(pool.map(run, calls))
+    
+    def _bulk_create_competencies(self, payloads: List[Dict[str, Any]]) -> List[Optional[int]]:
+        """
+        Erstellt mehrere Kompetenzen mit möglichst wenigen HTTP-Requests.
+        
+        Nutzt core_competency_create_competencies falls vorhanden, sonst
+        tool_mobile_call_external_functions (mehrere WS-Aufrufe in einem
+        POST). Ohne beide wird einzeln erstellt.
+        
+        Returns:
+            Moodle IDs in Reihenfolge der Payloads (None bei Fehler)
+        """
+        ids = []
+        for start in range(0, len(payloads), self.BULK_CHUNK_SIZE):
+            chunk = payloads[start:start + self.BULK_CHUNK_SIZE]
+            chunk_ids: Optional[List[Optional[int]]] = None
+            try:
+                if self._supports_function('core_competency_create_competencies'):
+                    response = self.moodle.call_function(
+                        'core_competency_create_competencies',
+                        competencies=chunk
+                    )
+                    chunk_ids = [comp['id'] for comp in response]
+                elif self._supports_function('tool_mobile_call_external_functions'):
+                    chunk_ids = self._create_via_multicall(chunk)
+            except (requests.ConnectionError, requests.HTTPError) as e:
+                # Request kam nicht bei Moodle an - einzeln nachholen ist sicher
+                logger.warning(f" Bulk-Request fehlgeschlagen, erstelle einzeln: {e}")
+            except Exception as e:
+                # Moodle hat den Request angenommen: ein Einzel-Retry würde an
+                # der idnumber-Eindeutigkeit scheitern, daher keine IDs
+                logger.error(f" Bulk-Erstellung fehlgeschlagen: {e}")
+                chunk_ids = [None] * len(chunk)
+            
+            if chunk_ids is None:
+                chunk_ids = self._create_one_by_one(chunk)
+            elif len(chunk_ids) != len(chunk):
+                logger.error(f" Bulk-Antwort mit {len(chunk_ids)} statt {len(chunk)} IDs - verwerfe Chunk")
+                chunk_ids = [None] * len(chunk)
+            
+            # Erst der vollständige Chunk geht in ids, damit ids und payloads
+            # (und damit die parent_ids der Kinder) ausgerichtet bleiben
+            ids.extend(chunk_ids)
+        return ids
+    
+    def _create_via_multicall(self, payloads: List[Dict[str, Any]]) -> List[Optional[int]]:
+        response = self.moodle.call_function(
+            'tool_mobile_call_external_functions',
+            requests=[
+                {
+                    'function': 'core_competency_create_competency',
+                    'arguments': json.dumps({'competency': payload})
+                }
+                for payload in payloads
+            ]
+        )
+        
+        ids = []
+        for payload, result in zip(payloads, response['responses']):
+            if result.get('error'):
+                logger.error(f"     Fehler bei Kompetenz '{payload['shortname']}': {result.get('exception')}")
+                ids.append(None)
+            else:
+                ids.append(json.loads(result['data'])['id'])
+        return ids
+    
+    def _create_one_by_one(self, payloads: List[Dict[str, Any]]) -> List[Optional[int]]:
+        results = self._call_many([
+            ('core_competency_create_competency', {'competency': payload})
+            for payload in payloads
+        ])
+        
+        ids = []
+        for payload, (response, error) in zip(payloads, results):
+            if error:
+                logger.error(f"     Fehler bei Kompetenz '{payload['shortname']}': {error}")
+                ids.append(None)
+            else:
+                ids.append(response['id'])
+        return ids
+    
+    def upload_competency_hierarchy(self, clusters: CompetencyBatch) -> Dict[str, int]:
         """
         Lädt die komplette Kompetenz-Hierarchie nach Moodle hoch.
         
         Args:
-            clusters: Dict mit ThemeClusters und Kompetenzen
+            clusters: CompetencyBatch mit ThemeClusters und Kompetenzen
             
         Returns:
             Mapping von Kompetenz-Namen zu Moodle IDs
@@ -222,43 +452,49 @@ class MoodleCompetencyUploader:
             
         logger.info(f" Lade {len(clusters)} Themenbereiche nach Moodle...")
         
-        # 1. Erstelle Parent-Kompetenzen (ThemeCluster)
-        parent_ids = {}
-        for cluster_name, cluster_data in clusters.items():
-            try:
-                parent_id = self.create_competency(
-                    name=cluster_name,
-                    description=cluster_data['description'],
-                    parent_id=0,  # Top-Level
-                    idnumber=f"cluster_{cluster_data['id']}"
-                )
-                parent_ids[cluster_name] = parent_id
-                logger.info(f"   Themenbereich erstellt: {cluster_name}")
-            except Exception as e:
-                logger.error(f"   Fehler bei Themenbereich '{cluster_name}': {e}")
+        # 1. Erstelle Parent-Kompetenzen (ThemeCluster) - ein Bulk-Request
+        parent_payloads = [
+            self._competency_payload(
+                name=clusters.cluster_names[c],
+                description=clusters.cluster_descs[c],
+                parent_id=0,  # Top-Level
+                idnumber=f"cluster_{clusters.cluster_ids[c]}"
+            )
+            for c in range(len(clusters))
+        ]
+        
+        # Parent-ID pro Cluster-Index (None = Erstellung fehlgeschlagen)
+        parent_ids = self._bulk_create_competencies(parent_payloads)
+        for cluster_name, parent_id in zip(clusters.cluster_names, parent_ids):
+            if parent_id is None:
+                logger.error(f"   Fehler bei Themenbereich '{cluster_name}'")
                 continue
+            self.competency_mapping[cluster_name] = parent_id
+            logger.debug("   Themenbereich erstellt: %s", cluster_name)
+        
+        # 2. Erstelle Child-Kompetenzen - braucht die Parent-IDs, daher zweiter Bulk-Request
+        child_idx = [
+            i for i, c in enumerate(clusters.comp_cluster_idx)
+            if parent_ids[c] is not None
+        ]
+        child_payloads = [
+            self._competency_payload(
+                name=clusters.names[i],
+                description=clusters.descriptions[i],
+                parent_id=parent_ids[clusters.comp_cluster_idx[i]]
+            )
+            for i in child_idx
+        ]
         
-        # 2. Erstelle Child-Kompetenzen
         total_comps = 0
-        for cluster_name, cluster_data in clusters.items():
-            if cluster_name not in parent_ids:
+        for i, comp_id in zip(child_idx, self._bulk_create_competencies(child_payloads)):
+            if comp_id is None:
                 continue
-                
-            parent_id = parent_ids[cluster_name]
-            
-            for comp in cluster_data['competencies']:
-                try:
-                    self.create_competency(
-                        name=comp['name'],
-                        description=comp['description'],
-                        parent_id=parent_id
-                    )
-                    total_comps += 1
-                except Exception as e:
-                    logger.error(f"     Fehler bei Kompetenz '{comp['name']}': {e}")
-                    continue
+            self.competency_mapping[clusters.names[i]] = comp_id
+            total_comps += 1
         
-        logger.info(f" Upload abgeschlossen: {len(parent_ids)} Themenbereiche, {total_comps} Kompetenzen")
+        created_parents = sum(1 for parent_id in parent_ids if parent_id is not None)
+        logger.info(f" Upload abgeschlossen: {created_parents} Themenbereiche, {total_comps} Kompetenzen")
         
         # NEU: Speichere Moodle IDs in Neo4j
         self.update_neo4j_with_moodle_ids()
@@ -269,29 +505,20 @@ class MoodleCompetencyUploader:
         """
         Aktualisiert Neo4j Competency Nodes mit den Moodle IDs.
         """
-        from llm.graph.neo4j_client import GraphDatabase
-        
-        db = GraphDatabase()
-        updated_count = 0
-        
         logger.info(" Aktualisiere Neo4j mit Moodle IDs...")
         
-        for comp_name, moodle_id in self.competency_mapping.items():
-            query = """
-            MATCH (c:Competency {name: $name})
-            SET c.moodle_id = $moodle_id
-            RETURN c.name
-            """
-            try:
-                result = db.execute_query(query, {
-                    "name": comp_name,
-                    "moodle_id": moodle_id
-                })
-                if result[0]:  # Wenn Knoten gefunden und aktualisiert
-                    updated_count += 1
-                    logger.debug(f"   {comp_name} -> Moodle ID {moodle_id}")
-            except Exception as e:
-                logger.error(f"   Fehler bei {comp_name}: {e}")
+        # Ein UNWIND statt einer Query pro Kompetenz: ein Round-Trip, ein Plan
+        rows = [
+            {"name": comp_name, "moodle_id": moodle_id}
+            for comp_name, moodle_id in self.competency_mapping.items()
+        ]
+        
+        updated_count = 0
+        try:
+            result, _ = self.db.execute_query(_Q_UPDATE_MOODLE_IDS, {"rows": rows})
+            updated_count = result[0][0] if result else 0
+        except Exception as e:
+            logger.error(f"   Fehler beim Aktualisieren der Moodle IDs: {e}")
         
         logger.info(f" {updated_count}/{len(self.competency_mapping)} Kompetenzen in Neo4j aktualisiert")
     
@@ -309,27 +536,31 @@ class MoodleCompetencyUploader:
             raise ValueError("Framework muss zuerst erstellt werden!")
             
         try:
-            # Alternative: Verwende search_competencies mit framework filter
-            response = self.moodle.call_function(
-                'core_competency_search_competencies',
-                searchtext='',  # Leerer Search text = alle
-                competencyframeworkid=self.framework_id
-            )
+            # Die IDs kennen wir vom Upload - kein erneutes Auflisten nötig
+            competency_ids = list(self.competency_mapping.values())
+            
+            if not competency_ids:
+                # Framework nicht von dieser Instanz befüllt: in Moodle suchen
+                response = self.moodle.call_function(
+                    'core_competency_search_competencies',
+                    searchtext='',  # Leerer Search text = alle
+                    competencyframeworkid=self.framework_id
+                )
+                competency_ids = [comp['id'] for comp in response]
             
-            competency_ids = [comp['id'] for comp in response]
+            # Füge jede Kompetenz zum Kurs hinzu (unabhängige Calls, parallel)
+            results = self._call_many([
+                ('core_competency_add_competency_to_course',
+                 {'courseid': course_id, 'competencyid': comp_id})
+                for comp_id in competency_ids
+            ])
             
-            # Füge jede Kompetenz zum Kurs hinzu
             added_count = 0
-            for comp_id in competency_ids:
-                try:
-                    self.moodle.call_function(
-                        'core_competency_add_competency_to_course',
-                        courseid=course_id,
-                        competencyid=comp_id
-                    )
+            for comp_id, (_, error) in zip(competency_ids, results):
+                if error:
+                    logger.warning(f" Kompetenz {comp_id} konnte nicht verknüpft werden: {error}")
+                else:
                     added_count += 1
-                except Exception as e:
-                    logger.warning(f" Kompetenz {comp_id} konnte nicht verknüpft werden: {e}")
             
             logger.info(f" {added_count}/{len(competency_ids)} Kompetenzen mit Kurs verknüpft")
             return added_count > 0
@@ -357,34 +588,71 @@ class MoodleCompetencyUploader:
             logger.warning(" Keine Kompetenzen zum Verknüpfen vorhanden")
             return 0
             
-        rules_set = 0
+        # Rule outcome options:
+        # 0 = None (nothing happens)
+        # 1 = Evidence (log completion as evidence)
+        # 2 = Recommend (flag for review)
+        # 3 = Complete (mark competency as complete)
         
-        # Setze für jede Kompetenz eine Rule
-        for comp_name, comp_id in self.competency_mapping.items():
-            try:
-                # Rule outcome options:
-                # 0 = None (nothing happens)
-                # 1 = Evidence (log completion as evidence)
-                # 2 = Recommend (flag for review)
-                # 3 = Complete (mark competency as complete)
-                
-                # Wir verwenden "Evidence" als Standard
-                # Das bedeutet: Wenn eine Aktivität abgeschlossen wird,
-                # wird dies als Beweis für diese Kompetenz geloggt
-                self.moodle.call_function(
-                    'core_competency_set_course_competency_ruleoutcome',
-                    coursecompetencyid=comp_id,
-                    ruleoutcome=1  # Evidence
-                )
+        # Wir verwenden "Evidence" als Standard
+        # Das bedeutet: Wenn eine Aktivität abgeschlossen wird,
+        # wird dies als Beweis für diese Kompetenz geloggt
+        
+        # Setze für jede Kompetenz eine Rule (unabhängige Calls, parallel)
+        comp_items = list(self.competency_mapping.items())
+        results = self._call_many([
+            ('core_competency_set_course_competency_ruleoutcome',
+             {'coursecompetencyid': comp_id, 'ruleoutcome': 1})  # Evidence
+            for _, comp_id in comp_items
+        ])
+        
+        rules_set = 0
+        for (comp_name, _), (_, error) in zip(comp_items, results):
+            if error:
+                logger.warning(f"   Fehler beim Setzen der Rule für '{comp_name}': {error}")
+            else:
                 rules_set += 1
-                logger.debug(f"   Rule gesetzt für: {comp_name}")
-                
-            except Exception as e:
-                logger.warning(f"   Fehler beim Setzen der Rule für '{comp_name}': {e}")
+                logger.debug("   Rule gesetzt für: %s", comp_name)
                 
         logger.info(f" {rules_set} Completion Rules gesetzt")
         return rules_set
     
+    def _get_course_assignments(self, course_id: int) -> Dict[str, Dict[str, int]]:
+        """
+        Assignments eines Kurses (Name -> Modul-/Instanz-ID), pro Instanz für
+        COURSE_CONTENTS_TTL gecacht.
+        
+        core_course_get_contents wird gestreamt geparst: nur 'assign'-Module
+        werden behalten, alle anderen Module nie vollständig aufgebaut.
+        """
+        entry = self._course_contents.get(course_id)
+        if entry and time.monotonic() - entry[0] < self.COURSE_CONTENTS_TTL:
+            return entry[1]
+        
+        # Sammle alle Assignments mit ihren IDs
+        moodle_assignments = {}
+        modules = self.moodle.iter_function_items(
+            'core_course_get_contents',
+            'item.modules.item',
+            courseid=course_id
+        )
+        for module in modules:
+            if module.get('modname') == 'assign':
+                moodle_assignments[module['name']] = {
+                    'module_id': module['id'],
+                    'instance_id': module.get('instance', 0)
+                }
+        
+        self._course_contents[course_id] = (time.monotonic(), moodle_assignments)
+        return moodle_assignments
+    
+    def invalidate_course_contents(self, course_id: int = None):
+        """Verwirft gecachte Kursinhalte (None = alle), z.B. nach Änderungen an Sektionen."""
+        if course_id is None:
+            self._course_contents.clear()
+        else:
+            self._course_contents.pop(course_id, None)
+    
     def map_assignment_competencies(self, course_shortname: str, course_id: int) -> int:
         """
         Mappt Assignment-REQUIRES Beziehungen aus Neo4j zu Moodle.
@@ -399,21 +667,7 @@ class MoodleCompetencyUploader:
         # 1. Hole Moodle Assignments
         logger.info(" Lade Moodle Assignments...")
         try:
-            course_contents = self.moodle.call_function(
-                'core_course_get_contents',
-                courseid=course_id
-            )
-            
-            # Sammle alle Assignments mit ihren IDs
-            moodle_assignments = {}
-            for section in course_contents:
-                if 'modules' in section:
-                    for module in section['modules']:
-                        if module.get('modname') == 'assign':
-                            moodle_assignments[module['name']] = {
-                                'module_id': module['id'],
-                                'instance_id': module.get('instance', 0)
-                            }
+            moodle_assignments = self._get_course_assignments(course_id)
             
             logger.info(f"  Gefunden: {len(moodle_assignments)} Assignments in Moodle")
             
@@ -422,13 +676,7 @@ class MoodleCompetencyUploader:
             return 0
         
         # 2. Hole Assignment-Kompetenz Mappings aus Neo4j
-        query = """
-        MATCH (a:Assignment)-[:REQUIRES]->(c:Competency)
-        WHERE a.course_id = $course_id
-        RETURN a.name as assignment_name, collect(c.name) as competencies
-        """
-        
-        result = self.db.execute_query(query, {'course_id': course_shortname.upper()})
+        result = self.db.execute_query(_Q_ASSIGNMENT_COMPETENCIES, {'course_id': course_shortname.upper()})
         data, _ = result
         
         if not data:
@@ -438,42 +686,85 @@ class MoodleCompetencyUploader:
         logger.info(f" {len(data)} Assignment-Mappings in Neo4j gefunden")
         
         # 3. Mappe Assignments zu Kompetenzen
-        mapped_count = 0
-        for row in data:
-            assignment_name, neo4j_competencies = row
-            
-            # Finde passendes Moodle Assignment
-            if assignment_name not in moodle_assignments:
-                logger.warning(f" Assignment '{assignment_name}' nicht in Moodle gefunden")
+        # Fehlende Assignments/Kompetenzen einmal gesammelt loggen statt pro Zeile
+        missing_assignments = {row[0] for row in data} - moodle_assignments.keys()
+        missing_comps = {c for _, comps in data for c in comps} - self.competency_mapping.keys()
+        if missing_assignments:
+            logger.warning(f" {len(missing_assignments)} Assignments nicht in Moodle gefunden: "
+                           f"{', '.join(sorted(missing_assignments))}")
+        if missing_comps:
+            logger.warning(f"   {len(missing_comps)} Kompetenzen nicht in Moodle gefunden: "
+                           f"{', '.join(sorted(missing_comps))}")
+        
+        links = []  # (assignment_name, comp_name, call)
+        for assignment_name, neo4j_competencies in data:
+            if assignment_name in missing_assignments:
                 continue
                 
             module_id = moodle_assignments[assignment_name]['module_id']
             
-            # Mappe Kompetenz-Namen zu Moodle IDs
-            for comp_name in neo4j_competencies:
-                if comp_name in self.competency_mapping:
-                    comp_id = self.competency_mapping[comp_name]
-                    
-                    try:
-                        # Verknüpfe Assignment-Modul mit Kompetenz 
-                        # Nutze das neue Plugin anstatt der nicht-existierenden core_competency Funktion
-                        self.moodle.call_function(
-                            'local_competency_linker_add_competency_to_module',
-                            cmid=module_id,
-                            competencyid=comp_id,
-                            ruleoutcome=1  # Evidence
-                        )
-                        mapped_count += 1
-                        logger.debug(f"   Verknüpft: {assignment_name} -> {comp_name}")
-                        
-                    except Exception as e:
-                        logger.warning(f"   Fehler beim Verknüpfen {assignment_name} -> {comp_name}: {e}")
-                else:
-                    logger.warning(f"   Kompetenz '{comp_name}' nicht in Moodle gefunden")
+            # Verknüpfe Assignment-Modul mit Kompetenz 
+            # Nutze das neue Plugin anstatt der nicht-existierenden core_competency Funktion
+            links.extend(
+                (assignment_name, comp_name, (
+                    'local_competency_linker_add_competency_to_module',
+                    {'cmid': module_id,
+                     'competencyid': self.competency_mapping[comp_name],
+                     'ruleoutcome': 1}  # Evidence
+                ))
+                for comp_name in neo4j_competencies
+                if comp_name not in missing_comps
+            )
+        
+        results = self._call_many([call for _, _, call in links])
+        
+        mapped_count = 0
+        for (assignment_name, comp_name, _), (_, error) in zip(links, results):
+            if error:
+                logger.warning(f"   Fehler beim Verknüpfen {assignment_name} -> {comp_name}: {error}")
+            else:
+                mapped_count += 1
+                logger.debug("   Verknüpft: %s -> %s", assignment_name, comp_name)
         
         logger.info(f" {mapped_count} Assignment-Kompetenz Verknüpfungen erstellt")
         return mapped_count
     
+    def _upload_state_file(self, course_shortname: str) -> Path:
+        return CACHE_DIR / f"{course_shortname.lower()}_upload_state.json"
+    
+    def _load_upload_state(self, course_shortname: str) -> Dict[str, Any]:
+        """Stand des letzten Uploads (Fingerprint, Framework, Mapping) oder {}."""
+        state_file = self._upload_state_file(course_shortname)
+        if not state_file.exists():
+            return {}
+        try:
+            with open(state_file, encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f" Upload-Status nicht lesbar: {e}")
+            return {}
+    
+    def _save_upload_state(self, course_shortname: str, state: Dict[str, Any]):
+        try:
+            CACHE_DIR.mkdir(exist_ok=True)
+            with open(self._upload_state_file(course_shortname), 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+        except Exception as e:
+            logger.warning(f" Upload-Status konnte nicht gespeichert werden: {e}")
+    
+    def _framework_exists(self, framework_id: Optional[int]) -> bool:
+        """Prüft, ob das Framework in Moodle noch existiert."""
+        if not framework_id:
+            return False
+        try:
+            self.moodle.call_function(
+                'core_competency_read_competency_framework',
+                id=framework_id
+            )
+            return True
+        except Exception:
+            return False
+    
     def full_upload_workflow(self, course_shortname: str, course_fullname: str, 
                             moodle_course_id: int) -> Dict[str, Any]:
         """
@@ -490,10 +781,7 @@ class MoodleCompetencyUploader:
         logger.info(f" Starte Kompetenz-Upload für {course_shortname}")
         
         try:
-            # 1. Framework erstellen
-            framework_id = self.create_framework_for_course(course_shortname, course_fullname)
-            
-            # 2. Kompetenzen aus Neo4j laden
+            # Kompetenzen aus Neo4j laden (vor dem Framework, für den Fingerprint)
             clusters = self.load_competencies_from_neo4j(course_shortname)
             
             if not clusters:
@@ -501,14 +789,54 @@ class MoodleCompetencyUploader:
                 return {
                     'success': False,
                     'message': 'Keine Kompetenzen gefunden',
-                    'framework_id': framework_id
+                    'framework_id': self.framework_id
                 }
             
-            # 3. Hierarchie hochladen
-            mapping = self.upload_competency_hierarchy(clusters)
-            
-            # 4. Mit Kurs verknüpfen
-            linked = self.link_framework_to_course(moodle_course_id)
+            # Unveränderte Hierarchie + Framework existiert noch -> Schritte 1-3 überspringen
+            fingerprint = hashlib.sha256(
+                json.dumps(asdict(clusters), sort_keys=True, ensure_ascii=False).encode('utf-8')
+            ).hexdigest()
+            state = self._load_upload_state(course_shortname)
+            
+            if (state.get('fingerprint') == fingerprint
+                    and self._framework_exists(state.get('framework_id'))):
+                logger.info(f" Kompetenz-Hierarchie unverändert - nutze Framework {state['framework_id']}")
+                framework_id = self.framework_id = state['framework_id']
+                self.competency_mapping = state['competency_mapping']
+                mapping = self.competency_mapping
+                # Fingerprint deckt nur Namen/Beschreibungen ab - nach einem
+                # Neo4j-Reset fehlen die moodle_ids, daher immer zurückschreiben
+                self.update_neo4j_with_moodle_ids()
+            else:
+                # 1. Framework erstellen
+                framework_id = self.create_framework_for_course(course_shortname, course_fullname)
+                
+                # 2./3. Hierarchie hochladen
+                mapping = self.upload_competency_hierarchy(clusters)
+                state = {
+                    'fingerprint': fingerprint,
+                    'framework_id': framework_id,
+                    'competency_mapping': mapping,
+                    'linked_courses': []
+                }
+                self._save_upload_state(course_shortname, state)
+            
+            # 4. Mit Kurs verknüpfen - Kursinhalte für Schritt 5 parallel vorladen.
+            # Die Modul-Verknüpfung selbst braucht die Kurs-Kompetenzen und
+            # wartet daher auf Schritt 4.
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                prefetch = pool.submit(self._get_course_assignments, moodle_course_id)
+                if moodle_course_id in state['linked_courses']:
+                    logger.info(f" Framework bereits mit Kurs {moodle_course_id} verknüpft")
+                    linked = True
+                else:
+                    linked = self.link_framework_to_course(moodle_course_id)
+                    if linked:
+                        state['linked_courses'].append(moodle_course_id)
+                        self._save_upload_state(course_shortname, state)
+                if prefetch.exception():
+                    # Schritt 5 versucht es erneut und loggt den Fehler
+                    logger.debug(" Vorladen der Kursinhalte fehlgeschlagen: %s", prefetch.exception())
             
             # 5. Assignment-Mappings (optional)
             assignment_count = self.map_assignment_competencies(course_shortname, moodle_course_id)
@@ -1,27 +1,106 @@
 """
 Moodle Course Downloader - Downloads course content for analysis
 """
+from __future__ import annotations
+
+import asyncio
+import hashlib
 import os
+import re
+import shutil
 from logger import get_logger
-from typing import List, Dict, Optional
-import requests
+from typing import TYPE_CHECKING, List, Dict, NamedTuple, Optional
 from pathlib import Path
 
 from .client import MoodleClient
 
+# aiohttp/aiofiles are only imported once files are actually downloaded;
+# the metadata getters (courses, assignments, ...) don't need them.
+if TYPE_CHECKING:
+    import aiohttp
+
 logger = get_logger(__name__)
 
+# Basic HTML stripping for assignment intros
+_HTML_TAG_RE = re.compile(r'<[^<]+?>')
+
+
+class DownloadJob(NamedTuple):
+    """A file to fetch, with Moodle's metadata for the up-to-date check."""
+    url: str
+    path: str
+    filesize: Optional[int] = None
+    timemodified: Optional[int] = None
+
+
+def _safe_dirname(name: str) -> str:
+    """Keep alphanumerics (incl. umlauts), spaces, '-' and '_'."""
+    return "".join(c for c in name if c.isalnum() or c in ' -_').rstrip()
+
 
 class CourseDownloader:
     """Downloads course content from Moodle for analysis."""
     
+    # Max. concurrent file downloads
+    DOWNLOAD_CONCURRENCY = 16
+    # Read/write chunk size while streaming a file to disk
+    CHUNK_SIZE = 1 << 16
+    # Reserve disk space up front for files at least this large
+    PREALLOCATE_MIN_BYTES = 8 << 20
+    # Connection pool: total keep-alive connections / per host
+    POOL_MAXSIZE = 32
+    POOL_PER_HOST = 16
+    # Retries for connection errors and transient gateway errors
+    RETRY_TOTAL = 3
+    RETRY_BACKOFF = 0.3
+    RETRY_STATUSES = frozenset({502, 503, 504})
+    
     def __init__(self, client: MoodleClient):
         self.client = client
+        # Query params merged into every file URL by aiohttp
+        self._file_params = {'token': client.token}
+        # core_course_get_contents per course id (files and submissions share it)
+        self._contents_cache: Dict[int, List[Dict]] = {}
+        # blake2b content hash per downloaded path, computed while streaming
+        self._hash_by_path: Dict[str, str] = {}
+        # One event loop + HTTP session shared by all downloads of this
+        # downloader, so keep-alive connections survive between calls.
+        self._runner: Optional[asyncio.Runner] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def close(self) -> None:
+        """Close the shared download session and its event loop."""
+        if self._runner is None:
+            return
+        if self._session is not None:
+            self._runner.run(self._session.close())
+            self._session = None
+        self._runner.close()
+        self._runner = None
+    
+    @property
+    def file_hashes(self) -> Dict[str, str]:
+        """
+        blake2b content hash (hex) per file downloaded by this downloader.
+        
+        Computed while streaming, so later stages can dedupe or verify files
+        without reading them again. Files skipped as up to date have no entry.
+        """
+        return dict(self._hash_by_path)
+    
+    def __enter__(self):
+        return self
     
-    def get_all_courses(self) -> List[Dict]:
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def get_all_courses(self, course_ids: Optional[List[int]] = None) -> List[Dict]:
         """
         Holt alle verfügbaren Kurse von Moodle.
         
+        Args:
+            course_ids: Optional - nur diese Kurse abfragen (serverseitig gefiltert)
+        
         Returns:
             Liste von Kurs-Dictionaries mit:
             - id: Kurs-ID
@@ -30,18 +109,20 @@ class CourseDownloader:
             - summary: Kursbeschreibung (optional)
         """
         logger.info("Fetching all courses from Moodle")
-        courses = self.client.call_function('core_course_get_courses')
+        params = {f'options[ids][{i}]': course_id for i, course_id in enumerate(course_ids or [])}
+        courses = self.client.call_function('core_course_get_courses', **params)
         
         # Filtere System-Kurs raus (ID 1 ist Startseite)
-        filtered_courses = []
-        for course in courses:
-            if course['id'] != 1:  # Skip site home
-                filtered_courses.append({
-                    'id': course['id'],
-                    'shortname': course['shortname'],
-                    'fullname': course['fullname'],
-                    'summary': course.get('summary', '')
-                })
+        filtered_courses = [
+            {
+                'id': course['id'],
+                'shortname': course['shortname'],
+                'fullname': course['fullname'],
+                'summary': course.get('summary', '')
+            }
+            for course in courses
+            if course['id'] != 1  # Skip site home
+        ]
         
         logger.info(f"Found {len(filtered_courses)} courses")
         return filtered_courses
@@ -81,11 +162,12 @@ class CourseDownloader:
         Returns:
             List of course sections with modules
         """
-        contents = self.client.call_function(
-            'core_course_get_contents',
-            courseid=course_id
-        )
-        return contents
+        if course_id not in self._contents_cache:
+            self._contents_cache[course_id] = self.client.call_function(
+                'core_course_get_contents',
+                courseid=course_id
+            )
+        return self._contents_cache[course_id]
     
     def download_course_files(self, course_id: int, target_dir: str) -> List[str]:
         """
@@ -98,60 +180,248 @@ class CourseDownloader:
         Returns:
             List of downloaded file paths
         """
-        downloaded_files = []
         contents = self.get_course_contents(course_id)
         
         # Create target directory
         Path(target_dir).mkdir(parents=True, exist_ok=True)
         
+        # Collect all files first, then download them concurrently
+        jobs = []
         for section in contents:
             section_name = section.get('name', 'Section')
             logger.info(f"Processing section: {section_name}")
             
             for module in section.get('modules', []):
-                if module['modname'] == 'resource':  # File resource
-                    file_info = self._download_module_files(module, target_dir)
-                    downloaded_files.extend(file_info)
-                elif module['modname'] == 'folder':  # Folder with files
-                    file_info = self._download_module_files(module, target_dir)
-                    downloaded_files.extend(file_info)
+                if module['modname'] in ('resource', 'folder'):  # File resource / folder with files
+                    jobs.extend(self._module_file_jobs(module, target_dir))
+        
+        downloaded_files = [path for path in self._download_jobs(jobs) if path]
                     
         logger.info(f"Downloaded {len(downloaded_files)} files from course")
         return downloaded_files
     
-    def _download_module_files(self, module: Dict, target_dir: str) -> List[str]:
-        """Download files from a module."""
-        downloaded = []
+    def _module_file_jobs(self, module: Dict, target_dir: str) -> List[DownloadJob]:
+        """Collect download jobs for the files of a module."""
+        jobs = []
         
         for content in module.get('contents', []):
             if content['type'] == 'file':
-                file_url = content['fileurl']
-                filename = content['filename']
-                
-                # Add token to URL
-                if '?' in file_url:
-                    file_url += f"&token={self.client.token}"
-                else:
-                    file_url += f"?token={self.client.token}"
+                # Keep the folder's subdirectories, same names may exist in several of them
+                subdir = content.get('filepath', '/').strip('/')
+                if subdir:
+                    os.makedirs(os.path.join(target_dir, subdir), exist_ok=True)
+                target_path = os.path.join(target_dir, subdir, content['filename'])
+                jobs.append(DownloadJob(
+                    content['fileurl'],
+                    target_path,
+                    content.get('filesize'),
+                    content.get('timemodified')
+                ))
                 
-                # Download file
-                target_path = os.path.join(target_dir, filename)
-                
-                try:
+        return jobs
+    
+    def _download_module_files(self, module: Dict, target_dir: str) -> List[str]:
+        """Download files from a module."""
+        jobs = self._module_file_jobs(module, target_dir)
+        return [path for path in self._download_jobs(jobs) if path]
+    
+    def _download_jobs(self, jobs: List[DownloadJob]) -> List[Optional[str]]:
+        """
+        Download jobs concurrently, skipping files that are already up to date.
+        
+        Sync entry point for the async pipeline, so callers stay unchanged.
+        Each target path is written by one job only (concurrent writers would
+        share the same '.part' file). Jobs for the same file URL (e.g. a file
+        linked from several modules) are fetched once and hardlinked for the
+        rest.
+        
+        Returns:
+            Target path per job (None if that download failed), in job order
+        """
+        if not jobs:
+            return []
+        
+        first_by_path = {}  # target path -> index of the job that writes it
+        first_by_url = {}  # file URL -> index of the job that downloads it
+        same_path = []  # (job index, source index)
+        unique, duplicates = [], []  # job indices / (job index, source index)
+        for i, job in enumerate(jobs):
+            if job.path in first_by_path:
+                source = first_by_path[job.path]
+                if jobs[source].url != job.url:
+                    logger.warning(f"Skipping {job.url}: {job.path} is already taken by another file")
+                same_path.append((i, source))
+                continue
+            first_by_path[job.path] = i
+            
+            if job.url in first_by_url:
+                duplicates.append((i, first_by_url[job.url]))
+                continue
+            first_by_url[job.url] = i
+            unique.append(i)
+        
+        if self._runner is None:
+            self._runner = asyncio.Runner()
+        fetched = self._runner.run(self._adownload_all([jobs[i] for i in unique]))
+        
+        results: List[Optional[str]] = [None] * len(jobs)
+        for i, path in zip(unique, fetched):
+            results[i] = path
+        for i, source in duplicates:
+            if results[source]:
+                results[i] = self._link_duplicate(results[source], jobs[i].path)
+        for i, source in same_path:
+            if jobs[source].url == jobs[i].url:
+                results[i] = results[source]
+        
+        if duplicates:
+            logger.info(f"Reused {len(duplicates)} duplicate files without downloading")
+        return results
+    
+    def _link_duplicate(self, source: str, target: str) -> Optional[str]:
+        """Hardlink an already downloaded file to another target (copy as fallback)."""
+        try:
+            if os.path.exists(target):
+                if os.path.samefile(source, target):
+                    return target
+                os.remove(target)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+        except OSError as e:
+            logger.error(f"Failed to reuse {os.path.basename(source)} for {target}: {e}")
+            return None
+        
+        if source in self._hash_by_path:
+            self._hash_by_path[target] = self._hash_by_path[source]
+        return target
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Lazily create the pooled session (must run inside the runner's loop)."""
+        if self._session is None:
+            import aiohttp
+            
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.POOL_MAXSIZE,
+                    limit_per_host=self.POOL_PER_HOST
+                ),
+                timeout=aiohttp.ClientTimeout(sock_connect=5, sock_read=60)
+            )
+        return self._session
+    
+    async def _adownload_all(self, jobs: List[DownloadJob]) -> List[Optional[str]]:
+        session = self._get_session()
+        sem = asyncio.Semaphore(self.DOWNLOAD_CONCURRENCY)
+        
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(self._adownload_file(session, job, sem))
+                for job in jobs
+            ]
+        
+        return [task.result() for task in tasks]
+    
+    def _preallocate(self, fd: int, size: Optional[int]) -> None:
+        """Reserve contiguous disk space for large files (fails early on a full disk)."""
+        if size and size >= self.PREALLOCATE_MIN_BYTES and hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+    
+    async def _is_up_to_date(self, session: aiohttp.ClientSession, job: DownloadJob,
+                             sem: asyncio.Semaphore) -> bool:
+        """
+        Check whether the local copy matches the server file.
+        
+        Uses Moodle's filesize/timemodified; only sends a HEAD request
+        when the contents metadata carries no size.
+        """
+        import aiohttp
+        
+        try:
+            stat = os.stat(job.path)
+        except FileNotFoundError:
+            return False
+        
+        if job.timemodified and stat.st_mtime < job.timemodified:
+            return False
+        
+        expected_size = job.filesize
+        if expected_size is None:
+            try:
+                async with sem, session.head(job.url, params=self._file_params, allow_redirects=True) as response:
+                    if response.status != 200:
+                        return False
+                    expected_size = response.content_length
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return False
+        
+        return expected_size is not None and stat.st_size == expected_size
+    
+    async def _adownload_file(self, session: aiohttp.ClientSession, job: DownloadJob,
+                              sem: asyncio.Semaphore) -> Optional[str]:
+        """
+        Stream a single file to disk. Errors are logged, not raised.
+        
+        Chunks go to a '.part' file that only replaces the target once the
+        body is complete, so an aborted stream never leaves a truncated file.
+        """
+        import aiofiles
+        import aiohttp
+        
+        url, path = job.url, job.path
+        filename = os.path.basename(path)
+        part_path = f"{path}.part"
+        
+        if await self._is_up_to_date(session, job, sem):
+            logger.debug(f"Up to date, skipping: {filename}")
+            return str(path)
+        
+        for attempt in range(self.RETRY_TOTAL + 1):
+            try:
+                async with sem, session.get(url, params=self._file_params) as response:
                     logger.debug(f"Downloading: {filename}")
-                    response = requests.get(file_url)
+                    if response.status in self.RETRY_STATUSES and attempt < self.RETRY_TOTAL:
+                        raise aiohttp.ClientConnectionError(f"HTTP {response.status}")
                     response.raise_for_status()
                     
-                    with open(target_path, 'wb') as f:
-                        f.write(response.content)
+                    # Unbuffered: chunks are already 64 KiB, a BufferedWriter would only add a copy
+                    digest = hashlib.blake2b(digest_size=16)
+                    written = 0
+                    async with aiofiles.open(part_path, 'wb', buffering=0) as f:
+                        self._preallocate(f.fileno(), job.filesize)
+                        async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                            digest.update(chunk)
+                            written += len(chunk)
+                            await f.write(chunk)
                     
-                    downloaded.append(target_path)
-                    logger.info(f"Downloaded: {filename}")
-                    
-                except Exception as e:
-                    logger.error(f"Failed to download {filename}: {e}")
-                    
-        return downloaded
+                    if job.filesize and written != job.filesize:
+                        raise aiohttp.ClientPayloadError(
+                            f"size mismatch: got {written} of {job.filesize} bytes"
+                        )
+                
+                os.replace(part_path, path)
+                self._hash_by_path[str(path)] = digest.hexdigest()
+                logger.info(f"Downloaded: {filename}")
+                return str(path)
+                
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt < self.RETRY_TOTAL:
+                    delay = self.RETRY_BACKOFF * (2 ** attempt)
+                    logger.debug(f"Retrying {filename} in {delay:.1f}s: {e}")
+                    await asyncio.sleep(delay)
+                    continue
+                logger.error(f"Failed to download {filename}: {e}")
+                
+            except Exception as e:
+                logger.error(f"Failed to download {filename}: {e}")
+            
+            break
+        
+        # Leftover of an aborted stream
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return None
     
     def get_enrolled_users(self, course_id: int) -> List[Dict]:
         """Get list of enrolled users in course."""
@@ -192,10 +462,7 @@ class CourseDownloader:
                         # Clean up the intro text (remove HTML)
                         for assign in assignments:
                             if 'intro' in assign:
-                                # Basic HTML stripping
-                                import re
-                                clean_intro = re.sub('<[^<]+?>', '', assign['intro'])
-                                assign['intro_text'] = clean_intro.strip()
+                                assign['intro_text'] = _HTML_TAG_RE.sub('', assign['intro']).strip()
                         
                         return assignments
             
@@ -233,6 +500,37 @@ class CourseDownloader:
             logger.error(f"Failed to get submissions: {e}")
             return []
     
+    def get_submissions_for_assignments(self, assignment_ids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Get submissions for several assignments with a single request.
+        
+        Args:
+            assignment_ids: The assignment IDs
+            
+        Returns:
+            Dict mapping assignment ID to its list of submissions
+        """
+        if not assignment_ids:
+            return {}
+        
+        try:
+            params = {
+                f'assignmentids[{i}]': assignment_id
+                for i, assignment_id in enumerate(assignment_ids)
+            }
+            result = self.client.call_function(
+                'mod_assign_get_submissions',
+                **params
+            )
+            
+            return {
+                assignment['assignmentid']: assignment.get('submissions', [])
+                for assignment in result.get('assignments', [])
+            }
+        except Exception as e:
+            logger.error(f"Failed to get submissions: {e}")
+            return {}
+    
     def download_assignment_submissions(self, course_id: int, target_dir: str, 
                                       only_submitted: bool = True) -> Dict[str, List[str]]:
         """
@@ -262,12 +560,17 @@ class CourseDownloader:
         
         logger.info(f"Downloading assignment submissions to: {submissions_dir}")
         
+        file_jobs = []        # DownloadJob
+        job_assignments = []  # assignment name per file job
+        created_dirs = set()
+        
         # Find all assignments
+        assignments = []  # (name, instance id)
         for section in contents:
-            assignment_modules = [m for m in section.get('modules', []) 
-                                if m['modname'] == 'assign']
-            
-            for assign in assignment_modules:
+            for assign in section.get('modules', []):
+                if assign['modname'] != 'assign':
+                    continue
+                
                 assign_name = assign.get('name', 'Unknown')
                 assign_id = assign.get('instance')
                 
@@ -275,64 +578,58 @@ class CourseDownloader:
                     logger.warning(f"No instance ID for assignment: {assign_name}")
                     continue
                 
-                logger.info(f"Processing assignment: {assign_name}")
-                
-                # Get submissions for this assignment
-                submissions = self.get_assignment_submissions(assign_id)
+                assignments.append((assign_name, assign_id))
+        
+        # Get submissions for all assignments in one WS call
+        submissions_by_id = self.get_submissions_for_assignments(
+            [assign_id for _, assign_id in assignments]
+        )
+        
+        for assign_name, assign_id in assignments:
+            logger.info(f"Processing assignment: {assign_name}")
+            submissions = submissions_by_id.get(assign_id, [])
+            
+            if not submissions:
+                logger.info(f"  No submissions found for: {assign_name}")
+                continue
+            
+            assign_dirname = f"assignment_{_safe_dirname(assign_name)}"
+            
+            for submission in submissions:
+                user_id = submission.get('userid')
+                status = submission.get('status', 'unknown')
                 
-                if not submissions:
-                    logger.info(f"  No submissions found for: {assign_name}")
+                # Skip if only_submitted and status is not 'submitted'
+                if only_submitted and status != 'submitted':
+                    logger.debug(f"  Skipping user {user_id} - status: {status}")
                     continue
                 
-                downloaded_files = []
-                
-                for submission in submissions:
-                    user_id = submission.get('userid')
-                    status = submission.get('status', 'unknown')
-                    
-                    # Skip if only_submitted and status is not 'submitted'
-                    if only_submitted and status != 'submitted':
-                        logger.debug(f"  Skipping user {user_id} - status: {status}")
-                        continue
-                    
-                    # Create user/assignment directory
-                    safe_assign_name = "".join(c for c in assign_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                    user_dir = submissions_dir / f"user_{user_id}" / f"assignment_{safe_assign_name}"
-                    user_dir.mkdir(parents=True, exist_ok=True)
-                    
-                    # Download files from submission
-                    for plugin in submission.get('plugins', []):
-                        if plugin['type'] == 'file':
-                            for filearea in plugin.get('fileareas', []):
-                                for file_info in filearea.get('files', []):
-                                    file_url = file_info['fileurl']
-                                    filename = file_info['filename']
-                                    
-                                    # Add token to URL
-                                    if '?' in file_url:
-                                        file_url += f"&token={self.client.token}"
-                                    else:
-                                        file_url += f"?token={self.client.token}"
-                                    
-                                    # Download file
-                                    target_path = user_dir / filename
-                                    
-                                    try:
-                                        logger.info(f"  Downloading submission from user {user_id}: {filename}")
-                                        response = requests.get(file_url)
-                                        response.raise_for_status()
-                                        
-                                        with open(target_path, 'wb') as f:
-                                            f.write(response.content)
-                                        
-                                        downloaded_files.append(str(target_path))
-                                        logger.info(f"   Downloaded: {target_path}")
-                                        
-                                    except Exception as e:
-                                        logger.error(f"   Failed to download {filename}: {e}")
+                user_dir = os.path.join(submissions_dir, f"user_{user_id}", assign_dirname)
                 
-                if downloaded_files:
-                    downloaded_submissions[assign_name] = downloaded_files
+                # Collect files from submission
+                for plugin in submission.get('plugins', []):
+                    if plugin['type'] == 'file':
+                        for filearea in plugin.get('fileareas', []):
+                            for file_info in filearea.get('files', []):
+                                # Create user/assignment directory once, only if it gets files
+                                file_dir = os.path.join(user_dir, file_info.get('filepath', '/').strip('/'))
+                                if file_dir not in created_dirs:
+                                    os.makedirs(file_dir, exist_ok=True)
+                                    created_dirs.add(file_dir)
+                                
+                                logger.debug(f"  Queued submission from user {user_id}: {file_info['filename']}")
+                                job_assignments.append(assign_name)
+                                file_jobs.append(DownloadJob(
+                                    file_info['fileurl'],
+                                    os.path.join(file_dir, file_info['filename']),
+                                    file_info.get('filesize'),
+                                    file_info.get('timemodified')
+                                ))
+        
+        # Download all submission files of the course concurrently
+        for assign_name, path in zip(job_assignments, self._download_jobs(file_jobs)):
+            if path:
+                downloaded_submissions.setdefault(assign_name, []).append(path)
         
         # Summary
         total_files = sum(len(files) for files in downloaded_submissions.values())
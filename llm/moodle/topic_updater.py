@@ -3,7 +3,10 @@ Moodle Topic/Section Updater
 Aktualisiert Topic-Summaries mit Lernzielen aus Neo4j
 """
 
-from typing import Dict, List, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 from .client import MoodleClient
 from llm.graph.neo4j_client import GraphDatabase
 from logger import get_logger
@@ -24,6 +27,64 @@ class MoodleTopicUpdater:
     def __init__(self, moodle_client: MoodleClient):
         self.moodle = moodle_client
         self.db = GraphDatabase()
+        # core_course_get_contents pro Moodle-Kurs, einmal pro Updater-Lauf
+        self._contents_cache: Dict[int, List[Dict]] = {}
+        # Section-Index pro Moodle-Kurs (siehe _get_section_index)
+        self._section_index: Dict[int, Tuple[Dict, List, Dict, List]] = {}
+    
+    def _get_course_contents(self, moodle_course_id: int) -> List[Dict]:
+        """Holt die Sections eines Kurses (gecacht)."""
+        if moodle_course_id not in self._contents_cache:
+            self._contents_cache[moodle_course_id] = self.moodle.call_function(
+                'core_course_get_contents', courseid=moodle_course_id
+            )
+        return self._contents_cache[moodle_course_id]
+    
+    def _get_section_index(self, moodle_course_id: int) -> Tuple[Dict, List, Dict, List]:
+        """
+        Baut einmalig den Lookup Name -> Section-Nummer für einen Kurs.
+        
+        Returns:
+            Tuple (doc_exact, doc_entries, assign_exact, assign_entries):
+            Exakte Namen (Modul-Namen + Dateinamen bzw. Assignment-Namen) als
+            Dict, dazu die (Name, Section)-Einträge in Kursreihenfolge für die
+            Teilstring-Suche, falls der exakte Lookup nichts findet.
+        """
+        if moodle_course_id not in self._section_index:
+            doc_exact, doc_entries = {}, []
+            assign_exact, assign_entries = {}, []
+            
+            for section in self._get_course_contents(moodle_course_id):
+                section_num = section.get('section', 0)
+                
+                for module in section.get('modules', []):
+                    module_name = module.get('name', '')
+                    names = [module_name]
+                    names.extend(c.get('filename', '') for c in module.get('contents', []))
+                    
+                    for name in names:
+                        doc_exact.setdefault(name, section_num)
+                        doc_entries.append((name, section_num))
+                    
+                    # Assignments haben modname='assign'
+                    if module.get('modname') == 'assign':
+                        assign_exact.setdefault(module_name, section_num)
+                        assign_entries.append((module_name, section_num))
+            
+            self._section_index[moodle_course_id] = (doc_exact, doc_entries, assign_exact, assign_entries)
+        
+        return self._section_index[moodle_course_id]
+    
+    @staticmethod
+    def _lookup_section(name: str, exact: Dict[str, int], entries: List[Tuple[str, int]]) -> Optional[int]:
+        """Exakter Treffer, sonst erster Eintrag der `name` als Teilstring enthält."""
+        section_num = exact.get(name)
+        if section_num is not None:
+            return section_num
+        for entry_name, entry_section in entries:
+            if name in entry_name:
+                return entry_section
+        return None
     
     def get_lernziele_by_document(self, course_id: str) -> Dict[str, List[str]]:
         """
@@ -43,8 +104,7 @@ class MoodleTopicUpdater:
         """
         
         try:
-            result = self.db.execute_query(query, {'course_id': course_id})
-            data, _ = result
+            data = self.db.read_query(query, {'course_id': course_id})
             
             doc_lernziele = {}
             for row in data:
@@ -63,7 +123,7 @@ class MoodleTopicUpdater:
         """
         Findet die Section-Nummer in der das Dokument verlinkt ist.
         
-        Durchsucht alle Course Sections nach dem Dokument-Namen.
+        Durchsucht Modul-Namen und Dateinamen aller Course Sections.
         
         Args:
             doc_name: Dokument-Name (z.B. "gdp01.pdf")
@@ -73,30 +133,12 @@ class MoodleTopicUpdater:
             Section-Nummer oder None
         """
         try:
-            # Hole alle Sections des Kurses
-            params = {
-                'courseid': moodle_course_id
-            }
-            sections = self.moodle.call_function('core_course_get_contents', **params)
+            doc_exact, doc_entries, _, _ = self._get_section_index(moodle_course_id)
+            section_num = self._lookup_section(doc_name, doc_exact, doc_entries)
             
-            # Durchsuche alle Sections
-            for section in sections:
-                section_num = section.get('section', 0)
-                
-                # Prüfe ob Dokument in den Modulen dieser Section ist
-                if 'modules' in section:
-                    for module in section['modules']:
-                        # Prüfe Modul-Name und Contents
-                        if doc_name in module.get('name', ''):
-                            logger.info(f"  Dokument {doc_name} gefunden in Section {section_num}")
-                            return section_num
-                        
-                        # Prüfe auch in den Contents
-                        if 'contents' in module:
-                            for content in module['contents']:
-                                if doc_name in content.get('filename', ''):
-                                    logger.info(f"  Dokument {doc_name} gefunden in Section {section_num}")
-                                    return section_num
+            if section_num is not None:
+                logger.info(f"  Dokument {doc_name} gefunden in Section {section_num}")
+                return section_num
             
             logger.warning(f"  Dokument {doc_name} nicht in Moodle gefunden")
             return None
@@ -105,33 +147,27 @@ class MoodleTopicUpdater:
             logger.error(f"Fehler beim Suchen der Section: {e}")
             return None
     
-    def format_lernziele_html(self, lernziele: List[str], doc_name: str = None) -> str:
+    def format_lernziele_html(self, lernziele: Iterable[str], doc_name: str = None) -> str:
         """
         Formatiert Lernziele als HTML für Moodle.
         
         Args:
-            lernziele: Liste von Lernziel-Beschreibungen
+            lernziele: Lernziel-Beschreibungen (Liste oder Iterable)
             doc_name: Optional - Dokument-Name für Titel
             
         Returns:
             HTML-formatierter String
         """
-        html = '<div class="lernziele">\n'
-        html += '<h4>Lernziele dieser Woche:</h4>\n'
+        parts = ['<div class="lernziele">\n<h4>Lernziele dieser Woche:</h4>\n']
         
         if doc_name:
-            html += f'<p><em>Basierend auf: {doc_name}</em></p>\n'
-        
-        html += '<p>Nach dieser Vorlesung können Sie:</p>\n'
-        html += '<ul>\n'
+            parts.append(f'<p><em>Basierend auf: {escape(doc_name)}</em></p>\n')
         
-        for lz in lernziele[:5]:  # Maximal 5 anzeigen
-            html += f'  <li>{lz}</li>\n'
+        parts.append('<p>Nach dieser Vorlesung können Sie:</p>\n<ul>\n')
+        parts.extend(f'  <li>{escape(lz)}</li>\n' for lz in islice(lernziele, 5))  # Maximal 5 anzeigen
+        parts.append('</ul>\n</div>')
         
-        html += '</ul>\n'
-        html += '</div>'
-        
-        return html
+        return ''.join(parts)
     
     def get_assignment_titles_from_neo4j(self, course_id: str) -> Dict[str, str]:
         """
@@ -152,8 +188,7 @@ class MoodleTopicUpdater:
         """
         
         try:
-            result = self.db.execute_query(query, {'course_id': course_id.upper()})
-            data, _ = result
+            data = self.db.read_query(query, {'course_id': course_id.upper()})
             
             assignment_titles = {}
             for row in data:
@@ -180,20 +215,12 @@ class MoodleTopicUpdater:
             Section-Nummer oder None
         """
         try:
-            params = {
-                'courseid': moodle_course_id
-            }
-            sections = self.moodle.call_function('core_course_get_contents', **params)
+            _, _, assign_exact, assign_entries = self._get_section_index(moodle_course_id)
+            section_num = self._lookup_section(assignment_name, assign_exact, assign_entries)
             
-            for section in sections:
-                section_num = section.get('section', 0)
-                
-                if 'modules' in section:
-                    for module in section['modules']:
-                        # Assignments haben modname='assign'
-                        if module.get('modname') == 'assign' and assignment_name in module.get('name', ''):
-                            logger.info(f"  Assignment '{assignment_name}' gefunden in Section {section_num}")
-                            return section_num
+            if section_num is not None:
+                logger.info(f"  Assignment '{assignment_name}' gefunden in Section {section_num}")
+                return section_num
             
             logger.warning(f"  Assignment '{assignment_name}' nicht in Moodle gefunden")
             return None
@@ -222,8 +249,7 @@ class MoodleTopicUpdater:
         """
         
         try:
-            result = self.db.execute_query(query, {'course_id': course_id.upper()})
-            data, _ = result
+            data = self.db.read_query(query, {'course_id': course_id.upper()})
             
             doc_titles = {}
             for row in data:
@@ -251,8 +277,16 @@ class MoodleTopicUpdater:
         """
         logger.info(f"Starte Topic-Update für Kurs {course_id}")
         
-        # 1. Hole Lernziele aus Neo4j
-        doc_lernziele = self.get_lernziele_by_document(course_id)
+        # 1. Hole Lernziele, Topic-Titel und Assignment-Titel parallel aus Neo4j
+        # (unabhängige Read-Queries, je eine eigene Driver-Session)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            lernziele_future = executor.submit(self.get_lernziele_by_document, course_id)
+            titles_future = executor.submit(self.get_topic_titles_from_neo4j, course_id)
+            assignments_future = executor.submit(self.get_assignment_titles_from_neo4j, course_id)
+        
+        doc_lernziele = lernziele_future.result()
+        doc_titles = titles_future.result()
+        assignment_titles = assignments_future.result()
         
         if not doc_lernziele:
             logger.warning("Keine Lernziele gefunden")
@@ -261,16 +295,13 @@ class MoodleTopicUpdater:
                 'message': 'Keine Lernziele in Neo4j gefunden'
             }
         
-        # 1b. Hole Topic-Titel aus Neo4j
-        doc_titles = self.get_topic_titles_from_neo4j(course_id)
-        
-        # 1c. Hole Assignment-Titel aus Neo4j
-        assignment_titles = self.get_assignment_titles_from_neo4j(course_id)
         logger.info(f"Assignment-Titel geladen: {len(assignment_titles)} gefunden")
         
-        # 2. Update Topics für Dokumente
-        updated_count = 0
-        failed_count = 0
+        # 2. Sammle Section-Updates für Dokumente
+        # section_num -> section_data; Dokument und Assignment in derselben
+        # Section werden zusammengeführt (Assignment-Titel gewinnt wie bisher)
+        section_updates: Dict[int, Dict[str, Any]] = {}
+        update_logs = []
         
         for doc_name, lernziele in doc_lernziele.items():
             section_num = self.find_document_section(doc_name, moodle_course_id)
@@ -280,45 +311,19 @@ class MoodleTopicUpdater:
                 continue
             
             # Formatiere Lernziele als HTML
-            summary_html = self.format_lernziele_html(lernziele, doc_name)
+            section_data = section_updates.setdefault(section_num, {'section': section_num})
+            section_data['summary'] = self.format_lernziele_html(lernziele, doc_name)
+            section_data['summaryformat'] = 1  # HTML
             
-            # Update Topic in Moodle mit local_wsmanagesections Plugin
-            try:
-                # Baue Section-Update-Parameter
-                section_data = {
-                    'section': section_num,
-                    'summary': summary_html,
-                    'summaryformat': 1  # HTML
-                }
-                
-                # Füge Topic-Titel hinzu wenn vorhanden
-                if doc_name in doc_titles:
-                    topic_title = doc_titles[doc_name]
-                    section_data['name'] = topic_title
-                    logger.info(f"  Setze Topic-Name: '{topic_title}' für Section {section_num}")
-                
-                # Nutze das externe Plugin local_wsmanagesections
-                # https://github.com/corvus-albus/moodle-local_wsmanagesections
-                params = {
-                    'courseid': moodle_course_id,
-                    'sections': [section_data]
-                }
-                
-                result = self.moodle.call_function('local_wsmanagesections_update_sections', **params)
-                
-                # Moodle returns empty array on success
-                if isinstance(result, list) or (isinstance(result, dict) and not result.get('exception')):
-                    logger.info(f"  Topic {section_num} aktualisiert mit {len(lernziele)} Lernzielen")
-                    updated_count += 1
-                else:
-                    logger.error(f"  Fehler bei Topic {section_num}: {result}")
-                    failed_count += 1
-                    
-            except Exception as e:
-                logger.error(f"  Fehler bei Topic {section_num}: {e}")
-                failed_count += 1
+            # Füge Topic-Titel hinzu wenn vorhanden
+            if doc_name in doc_titles:
+                topic_title = doc_titles[doc_name]
+                section_data['name'] = topic_title
+                logger.info(f"  Setze Topic-Name: '{topic_title}' für Section {section_num}")
+            
+            update_logs.append(f"  Topic {section_num} aktualisiert mit {len(lernziele)} Lernzielen")
         
-        # 2b. Update Topics für Assignments (nur Titel, keine Lernziele)
+        # 2b. Sammle Updates für Assignments (nur Titel, keine Lernziele)
         for assignment_name, assignment_title in assignment_titles.items():
             section_num = self.find_assignment_section(assignment_name, moodle_course_id)
             
@@ -326,28 +331,35 @@ class MoodleTopicUpdater:
                 logger.warning(f"  Kann Assignment '{assignment_name}' keinem Topic zuordnen")
                 continue
             
-            # Update nur den Topic-Namen für Assignments
+            section_updates.setdefault(section_num, {'section': section_num})['name'] = assignment_title
+            update_logs.append(f"  Topic {section_num} Name aktualisiert für Assignment: '{assignment_title}'")
+        
+        # 2c. Alle Sections in einem Aufruf updaten (local_wsmanagesections Plugin)
+        # https://github.com/corvus-albus/moodle-local_wsmanagesections
+        updated_count = 0
+        failed_count = 0
+        
+        if section_updates:
             try:
                 params = {
                     'courseid': moodle_course_id,
-                    'sections': [{
-                        'section': section_num,
-                        'name': assignment_title
-                    }]
+                    'sections': list(section_updates.values())
                 }
                 
                 result = self.moodle.call_function('local_wsmanagesections_update_sections', **params)
                 
+                # Moodle returns empty array on success
                 if isinstance(result, list) or (isinstance(result, dict) and not result.get('exception')):
-                    logger.info(f"  Topic {section_num} Name aktualisiert für Assignment: '{assignment_title}'")
-                    updated_count += 1
+                    for message in update_logs:
+                        logger.info(message)
+                    updated_count = len(update_logs)
                 else:
-                    logger.error(f"  Fehler bei Assignment Topic {section_num}: {result}")
-                    failed_count += 1
+                    logger.error(f"  Fehler beim Topic-Update: {result}")
+                    failed_count = len(update_logs)
                     
             except Exception as e:
-                logger.error(f"  Fehler bei Assignment Topic {section_num}: {e}")
-                failed_count += 1
+                logger.error(f"  Fehler beim Topic-Update: {e}")
+                failed_count = len(update_logs)
         
         # 3. Ergebnis
         return {
@@ -0,0 +1,165 @@
+"""
+Inkrementeller JSON-Parser für gestreamte LLM-Antworten
+=======================================================
+Zustandsautomat über einen Zeichenstrom, der die Top-Level-Felder eines
+JSON-Objekts liefert, sobald ihr Wert vollständig empfangen wurde.
+Jedes Zeichen wird genau einmal angefasst (O(n) über alle Chunks).
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Zustände des Automaten
+SEEK_OBJECT = 0    # Vor dem ersten '{' (z.B. Markdown-Fence ```json)
+EXPECT_KEY = 1     # Innerhalb des Objekts, wartet auf '"' oder '}'
+IN_KEY = 2         # Innerhalb eines Key-Strings
+EXPECT_COLON = 3   # Nach dem Key, wartet auf ':'
+EXPECT_VALUE = 4   # Nach ':', wartet auf den Wertanfang
+IN_STRING = 5      # Innerhalb eines String-Werts
+IN_CONTAINER = 6   # Innerhalb eines verschachtelten Objekts/Arrays
+IN_SCALAR = 7      # Innerhalb von Zahl / true / false / null
+AFTER_VALUE = 8    # Nach einem Wert, wartet auf ',' oder '}'
+DONE = 9           # Top-Level-Objekt geschlossen
+
+_WHITESPACE = " \t\r\n"
+_SCALAR_END = ",}" + _WHITESPACE
+
+
+class IncrementalJSONParser:
+    """
+    Parst ein JSON-Objekt Chunk für Chunk.
+
+    `feed()` gibt die `(path, value)`-Events der Top-Level-Felder zurück,
+    die im aktuellen Chunk abgeschlossen wurden. `path` ist ein Tupel mit
+    dem Feldnamen, z.B. `("tipp",)`. Werte werden mit `strict=False`
+    dekodiert, d.h. unescapte Zeilenumbrüche in Strings sind erlaubt.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self._state = SEEK_OBJECT
+        self._escape = False
+        self._in_nested_string = False
+        self._depth = 0
+        self._key = None
+        self._parts: List[str] = []  # Roh-Fragmente des aktuellen Keys/Werts
+
+    @property
+    def done(self) -> bool:
+        """True, sobald das Top-Level-Objekt geschlossen wurde."""
+        return self._state == DONE
+
+    def has_fields(self, names: Iterable[str]) -> bool:
+        """Prüft, ob alle angegebenen Felder bereits vollständig vorliegen."""
+        return all(name in self.fields for name in names)
+
+    def feed(self, text: str) -> List[Tuple[Tuple[str, ...], Any]]:
+        events = []
+        state = self._state
+        start = 0  # Anfang des aktuellen Fragments in `text`
+        i = 0
+        n = len(text)
+
+        while i < n:
+            ch = text[i]
+
+            if state == IN_STRING or state == IN_KEY:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._parts.append(text[start:i + 1])
+                    raw = "".join(self._parts)
+                    self._parts = []
+                    if state == IN_KEY:
+                        self._key = json.loads(raw, strict=False)
+                        state = EXPECT_COLON
+                    else:
+                        self._emit(raw, events)
+                        state = AFTER_VALUE
+
+            elif state == IN_CONTAINER:
+                if self._in_nested_string:
+                    if self._escape:
+                        self._escape = False
+                    elif ch == "\\":
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_nested_string = False
+                elif ch == '"':
+                    self._in_nested_string = True
+                elif ch in "{[":
+                    self._depth += 1
+                elif ch in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._parts.append(text[start:i + 1])
+                        raw = "".join(self._parts)
+                        self._parts = []
+                        self._emit(raw, events)
+                        state = AFTER_VALUE
+
+            elif state == IN_SCALAR:
+                if ch in _SCALAR_END:
+                    self._parts.append(text[start:i])
+                    raw = "".join(self._parts)
+                    self._parts = []
+                    self._emit(raw, events)
+                    state = AFTER_VALUE
+                    continue  # Zeichen im neuen Zustand erneut auswerten
+
+            elif ch in _WHITESPACE:
+                pass
+
+            elif state == SEEK_OBJECT:
+                if ch == "{":
+                    state = EXPECT_KEY
+
+            elif state == EXPECT_KEY:
+                if ch == '"':
+                    start = i
+                    state = IN_KEY
+                elif ch == "}":
+                    state = DONE
+
+            elif state == EXPECT_COLON:
+                if ch == ":":
+                    state = EXPECT_VALUE
+
+            elif state == EXPECT_VALUE:
+                start = i
+                if ch == '"':
+                    state = IN_STRING
+                elif ch in "{[":
+                    self._depth = 1
+                    state = IN_CONTAINER
+                else:
+                    state = IN_SCALAR
+
+            elif state == AFTER_VALUE:
+                if ch == ",":
+                    state = EXPECT_KEY
+                elif ch == "}":
+                    state = DONE
+
+            elif state == DONE:
+                break
+
+            i += 1
+
+        # Unvollständiges Fragment für den nächsten Chunk aufheben
+        if state in (IN_KEY, IN_STRING, IN_CONTAINER, IN_SCALAR):
+            self._parts.append(text[start:])
+
+        self._state = state
+        return events
+
+    def _emit(self, raw: str, events: list):
+        try:
+            value = json.loads(raw, strict=False)
+        except json.JSONDecodeError:
+            # Kaputter Wert - Feld auslassen, Aufrufer fällt auf Vollparse zurück
+            return
+        self.fields[self._key] = value
+        events.append(((self._key,), value))
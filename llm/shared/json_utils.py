@@ -5,11 +5,98 @@ Zentrale Funktionen zur Bereinigung und Parsing von LLM JSON-Antworten.
 """
 
 import json
+import re
+import orjson
 from logger import get_logger
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 logger = get_logger(__name__)
 
+# orjson.JSONDecodeError ist Subklasse von json.JSONDecodeError,
+# die except-Zweige unten greifen daher unverändert
+
+# Zeichen, die für den String-Zustand relevant sind: Quote, Backslash, Newline
+_STRING_SPECIAL_RE = re.compile(r'["\\\n]')
+
+
+def _escape_newlines_in_json_strings(content: str) -> str:
+    """
+    Escaped rohe Newlines innerhalb von JSON-String-Werten.
+    
+    Ein linearer Durchlauf: springt nur die relevanten Zeichen an und
+    verfolgt dabei, ob man sich in einem String befindet (inkl. Escapes).
+    Newlines außerhalb von Strings bleiben unverändert.
+    """
+    parts = []
+    start = 0
+    in_string = False
+    escaped_pos = -1  # Position des Zeichens nach einem Backslash
+    
+    for match in _STRING_SPECIAL_RE.finditer(content):
+        i = match.start()
+        if i == escaped_pos:
+            continue
+        
+        ch = content[i]
+        if ch == '\\':
+            if in_string:
+                escaped_pos = i + 1
+        elif ch == '"':
+            in_string = not in_string
+        elif in_string:
+            parts.append(content[start:i])
+            parts.append('\\n')
+            start = i + 1
+    
+    parts.append(content[start:])
+    return ''.join(parts)
+
+
+# Zeichen, die für die Klammertiefe relevant sind
+_OBJECT_SPECIAL_RE = re.compile(r'[{}"\\]')
+
+
+def _extract_json_object(content: str) -> Optional[str]:
+    """
+    Schneidet das erste vollständige JSON-Objekt aus dem Text aus.
+    
+    Ein Durchlauf ab dem ersten '{': zählt die Klammertiefe und ignoriert
+    Klammern innerhalb von String-Werten. Text vor oder nach dem Objekt
+    (z.B. Erklärungen des Modells) fällt weg.
+    
+    Returns:
+        Das Objekt als String oder None, wenn es nicht geschlossen wird
+    """
+    json_start = content.find("{")
+    if json_start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped_pos = -1
+    
+    for match in _OBJECT_SPECIAL_RE.finditer(content, json_start):
+        i = match.start()
+        if i == escaped_pos:
+            continue
+        
+        ch = content[i]
+        if ch == '\\':
+            if in_string:
+                escaped_pos = i + 1
+        elif ch == '"':
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif ch == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return content[json_start:i + 1]
+    
+    return None
+
 
 def clean_json_response(content: str, provider: Optional[str] = None) -> str:
     """
@@ -26,56 +113,61 @@ def clean_json_response(content: str, provider: Optional[str] = None) -> str:
     Returns:
         Bereinigter JSON-String
     """
+    return _clean_and_parse(content, provider)[0]
+
+
+def _clean_and_parse(content: str, provider: Optional[str] = None) -> Tuple[str, Any]:
+    """
+    Bereinigung wie clean_json_response, liefert zusätzlich das Parse-Ergebnis.
+    
+    Returns:
+        Tuple (bereinigter String, geparstes JSON oder None wenn der
+        Probe-Parse vor dem Newline-Escaping fehlschlug)
+    """
     content = content.strip()
     
     # Standard-Bereinigung für alle Modelle
-    if content.startswith("```json"):
-        content = content[7:]
-    elif content.startswith("```"):
-        content = content[3:]
-    
-    if content.endswith("```"):
-        content = content[:-3]
-    
-    content = content.strip()
+    # Fast-Path: Ohne Backtick an Anfang oder Ende gibt es keinen Code-Fence
+    if content[:1] == "`" or content[-1:] == "`":
+        if content.startswith("```json"):
+            content = content[7:]
+        elif content.startswith("```"):
+            content = content[3:]
+        
+        if content.endswith("```"):
+            content = content[:-3]
+        
+        content = content.strip()
     
     # CLAUDE-SPEZIFISCHE Bereinigung nur bei Claude-Modellen
     if provider == "claude":
         logger.debug(" Claude-spezifische JSON-Bereinigung aktiv")
         
         # Robuste JSON-Extraktion: Finde JSON-Block wenn vorhanden
-        json_start = content.find("{")
-        json_end = content.rfind("}") + 1
+        extracted = _extract_json_object(content)
+        
+        if extracted is None:
+            # Nicht balanciert (z.B. abgeschnittene Antwort): vom ersten '{' bis zum letzten '}'
+            json_start = content.find("{")
+            json_end = content.rfind("}") + 1
+            if json_start != -1 and json_end > json_start:
+                extracted = content[json_start:json_end]
         
-        if json_start != -1 and json_end > json_start:
-            extracted = content[json_start:json_end]
-            logger.debug(f" JSON extrahiert: {len(extracted)} Zeichen (Original: {len(content)})")
+        if extracted is not None:
+            logger.debug(" JSON extrahiert: %d Zeichen (Original: %d)", len(extracted), len(content))
             content = extracted
     
     # WICHTIG: Escape newlines in String-Werten für valides JSON
     # Dies behebt das Problem mit mehrzeiligen Feedback-Texten
     try:
         # Versuche erst zu parsen - wenn es klappt, ist alles gut
-        json.loads(content)
+        return content, orjson.loads(content)
     except json.JSONDecodeError:
-        # Claude-spezifisch: Aggressiveres Newline-Escaping
-        if provider == "claude":
-            import re
-            # Finde alle String-Werte zwischen Quotes und escape Newlines darin
-            def escape_newlines_in_strings(match):
-                # Escape alle Newlines innerhalb des gefundenen Strings
-                return match.group(0).replace('\n', '\\n')
-            
-            # Pattern für JSON String-Werte: "..." aber nicht bereits escaped \"
-            content = re.sub(r'"[^"\\]*(?:\\.[^"\\]*)*"', escape_newlines_in_strings, content)
-            logger.debug(" Claude: Newlines in allen JSON-Strings escaped")
-        else:
-            # Standard-Ansatz für andere Provider
-            import re
-            content = re.sub(r'(?<!\\)\n(?!["\s]*[,}])', r'\\n', content)
-            logger.debug(" Newlines in JSON-Strings escaped")
+        # Für alle Provider: Newlines nur innerhalb von String-Werten escapen
+        content = _escape_newlines_in_json_strings(content)
+        logger.debug(" Newlines in JSON-Strings escaped")
     
-    return content
+    return content, None
 
 
 def parse_llm_json(content: str, provider: Optional[str] = None) -> Dict[str, Any]:
@@ -93,11 +185,21 @@ def parse_llm_json(content: str, provider: Optional[str] = None) -> Dict[str, An
         json.JSONDecodeError: Wenn JSON nicht geparst werden kann
         ValueError: Wenn bereinigter Content kein valides JSON ist
     """
-    cleaned = clean_json_response(content, provider)
+    # Fast-Path: Bereits sauberes JSON-Objekt ohne Bereinigung parsen
+    if content[:1] == "{" and content[-1:] == "}":
+        try:
+            return orjson.loads(content)
+        except json.JSONDecodeError:
+            pass
+    
+    # Der Probe-Parse der Bereinigung ist meist schon das Ergebnis
+    cleaned, parsed = _clean_and_parse(content, provider)
+    if parsed is not None:
+        return parsed
     
     try:
-        return json.loads(cleaned)
+        return orjson.loads(cleaned)
     except json.JSONDecodeError as e:
         logger.error(f"JSON Parse Error: {e}")
-        logger.debug(f"Bereinigte Antwort war: {cleaned[:500]}...")
+        logger.debug("Bereinigte Antwort war: %s...", cleaned[:500])
         raise ValueError(f"Fehler beim Parsen der LLM-Antwort: {e}")
\ No newline at end of file
@@ -1,14 +1,14 @@
 
 # llm/shared/llm_factory.py
 
+import json
 import os
-from typing import Optional, Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Sequence
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_community.chat_models import ChatOllama
+from langchain_core.caches import InMemoryCache
 from langchain_core.language_models import BaseChatModel
-from openai import max_retries
 
 from logger import get_logger
 
@@ -22,8 +22,10 @@ EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
 
 # Ollama Base URL konfigurierbar über Umgebungsvariable
 # Für HTW-Cluster: OLLAMA_BASE_URL=https://f2ki-h100-1.f2.htw-berlin.de:11435
-# OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-# print(f"{OLLAMA_BASE_URL} wird als Ollama Base URL verwendet.")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Einmal beim Import auswerten statt bei jedem get_llm-Aufruf
+_OLLAMA_IS_HTW = "htw-berlin" in OLLAMA_BASE_URL
+
 # Modell → Provider Mapping mit Beschreibungen
 MODEL_TO_PROVIDER = {
     # OpenAI Modelle
@@ -47,15 +49,79 @@ MODEL_TO_PROVIDER = {
     "qwen3:32b": "ollama",                    # Qwen 3 32B - Schneller & gut
 }
 
+# OpenAI Modelle mit JSON-Mode (response_format={"type": "json_object"})
+# Antwort ist garantiert valides JSON ohne Markdown-Fences
+JSON_MODE_MODELS = {"gpt-4o", "gpt-4o-mini", "gpt-5", "o3"}
+
+
+# OpenAI Reasoning-Modelle ohne temperature-Parameter (zusätzlich alle "o1*")
+NO_TEMPERATURE_MODELS = frozenset({"o3", "gpt-5"})
+
+
+def supports_json_mode(model: str) -> bool:
+    """Prüft, ob das Modell einen garantierten JSON-Output-Modus hat."""
+    return model in JSON_MODE_MODELS
+
+
+def _ignores_temperature(model: str) -> bool:
+    """True für Modelle, die keine temperature unterstützen (o1, o3, gpt-5)."""
+    return model in NO_TEMPERATURE_MODELS or model.startswith("o1")
+
+
+class _CountingCache(InMemoryCache):
+    """InMemoryCache für LLM-Antworten, zählt Treffer für das Logging."""
+    
+    def __init__(self, maxsize: Optional[int] = None):
+        super().__init__(maxsize=maxsize)
+        self.stats = {"hits": 0, "misses": 0}
+    
+    def lookup(self, prompt: str, llm_string: str):
+        result = super().lookup(prompt, llm_string)
+        self.stats["hits" if result is not None else "misses"] += 1
+        if result is not None:
+            logger.debug("LLM-Cache Treffer (%d Treffer, %d Misses)", self.stats["hits"], self.stats["misses"])
+        return result
 
 
-def get_llm(model: str,temperature: float = 0.1,**kwargs) -> BaseChatModel:
+# Antwort-Cache für deterministische Aufrufe (temperature <= 0): gleicher Prompt
+# und gleiche Modell-Konfiguration -> gespeicherte Antwort statt API-Aufruf
+RESPONSE_CACHE = _CountingCache(maxsize=int(os.getenv("LLM_RESPONSE_CACHE_SIZE", "1024")))
+
+# Gemeinsamer HTTP-Client für alle OpenAI-Instanzen (Keep-Alive + HTTP/2),
+# wird beim ersten OpenAI-Modell erstellt
+_shared_http_client = None
+
+
+def _get_shared_http_client():
+    """Liefert den geteilten httpx.Client (thread-safe, nur synchrone Aufrufe)."""
+    global _shared_http_client
+    if _shared_http_client is None:
+        import httpx
+        _shared_http_client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        )
+    return _shared_http_client
+
+
+# Bereits erstellte LLM-Instanzen pro Konfiguration (Modell, Temperatur, kwargs),
+# als LRU auf LLM_CACHE_SIZE Einträge begrenzt
+LLM_CACHE_SIZE = 32
+_llm_cache: "OrderedDict[tuple, BaseChatModel]" = OrderedDict()
+_llm_cache_lock = threading.Lock()
+
+
+
+def get_llm(model: str,temperature: float = 0.1,
+            response_format: Optional[Dict[str, Any]] = None,**kwargs) -> BaseChatModel:
     """
     Zentrale Factory für LLM-Instanzen.
     
     Args:
         model: Modellname (z.B. "claude-3-5-sonnet-20241022", "gpt-4o")
         temperature: Temperatur für die Generierung
+        response_format: Optional - z.B. {"type": "json_object"} für OpenAI JSON-Mode
+                         (wird bei Modellen ohne JSON-Mode ignoriert)
         **kwargs: Zusätzliche Parameter für das Modell
         
     Returns:
@@ -64,17 +130,53 @@ def get_llm(model: str,temperature: float = 0.1,**kwargs) -> BaseChatModel:
     Raises:
         ValueError: Bei unbekanntem Modell
     """
+    # Gleiche Konfiguration -> gleiche Instanz (spart Client-Setup und Validierung);
+    # kwargs können unhashbare Werte enthalten, daher als JSON-Key
+    cache_key = (model, temperature, json.dumps(
+        {"response_format": response_format, **kwargs}, sort_keys=True, default=str
+    ))
     
-    if model not in MODEL_TO_PROVIDER:
+    with _llm_cache_lock:
+        llm = _llm_cache.get(cache_key)
+        if llm is None:
+            llm = _create_llm(model, temperature, response_format, **kwargs)
+            _llm_cache[cache_key] = llm
+            if len(_llm_cache) > LLM_CACHE_SIZE:
+                _llm_cache.popitem(last=False)
+        else:
+            _llm_cache.move_to_end(cache_key)
+    
+    return llm
+
+
+def _create_llm(model: str, temperature: float,
+                response_format: Optional[Dict[str, Any]], **kwargs) -> BaseChatModel:
+    """Erstellt eine neue LLM-Instanz (ungecacht, siehe get_llm)."""
+    provider = MODEL_TO_PROVIDER.get(model)
+    if provider is None:
         raise ValueError(f"Unbekanntes Modell: {model}. Verfügbare: {list(MODEL_TO_PROVIDER.keys())}")
     
-    provider = MODEL_TO_PROVIDER[model]
-    logger.debug(f"Erstelle LLM: model={model}, provider={provider}")
+    logger.debug("Erstelle LLM: model=%s, provider=%s", model, provider)
+    
+    if response_format:
+        if supports_json_mode(model):
+            kwargs["model_kwargs"] = {**kwargs.get("model_kwargs", {}), "response_format": response_format}
+        else:
+            logger.debug("response_format wird für %s ignoriert", model)
+    
+    # Nur deterministische Aufrufe cachen; Modelle ohne temperature (o1/o3/gpt-5)
+    # sampeln immer und werden daher nie gecacht
+    if temperature <= 0 and "cache" not in kwargs and not _ignores_temperature(model):
+        kwargs["cache"] = RESPONSE_CACHE
     
-    # LLM erstellen
+    # LLM erstellen (Provider-Pakete erst hier importieren, nur der genutzte wird geladen)
     if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        # Alle OpenAI-Modelle teilen sich Verbindungspool und TLS-Sessions
+        kwargs.setdefault("http_client", _get_shared_http_client())
+        
         # o1, o3 und gpt-5 Modelle unterstützen keine temperature
-        if model.startswith("o1") or model in ["o3", "gpt-5"]:
+        if _ignores_temperature(model):
             llm = ChatOpenAI(
                 model=model,
                 **kwargs  # Keine temperature!
@@ -86,6 +188,7 @@ def get_llm(model: str,temperature: float = 0.1,**kwargs) -> BaseChatModel:
                 **kwargs
             )
     elif provider == "claude":
+        from langchain_anthropic import ChatAnthropic
         llm = ChatAnthropic(
             model=model,
             temperature=temperature,
@@ -93,6 +196,7 @@ def get_llm(model: str,temperature: float = 0.1,**kwargs) -> BaseChatModel:
         )
     
     elif provider == "ollama":
+        from langchain_community.chat_models import ChatOllama
         # Ollama verwendet das Modell direkt ohne Präfix
         ollama_model = model.replace("ollama/", "") if model.startswith("ollama/") else model
         
@@ -104,10 +208,10 @@ def get_llm(model: str,temperature: float = 0.1,**kwargs) -> BaseChatModel:
             temperature=temperature,
             **kwargs
         )
-        logger.info(f" Ollama LLM erstellt: {ollama_model} @ {OLLAMA_BASE_URL}")
+        logger.info(" Ollama LLM erstellt: %s @ %s", ollama_model, OLLAMA_BASE_URL)
         
         # Hinweis wenn HTW-URL verwendet wird
-        if "htw-berlin" in OLLAMA_BASE_URL:
+        if _OLLAMA_IS_HTW:
             logger.info("    Nutze HTW Berlin GPU-Cluster (VPN erforderlich!)")
         
     else:
@@ -116,6 +220,32 @@ def get_llm(model: str,temperature: float = 0.1,**kwargs) -> BaseChatModel:
     return llm
 
 
+# Obergrenze paralleler LLM-Requests in invoke_many / ainvoke_many
+MAX_LLM_CONCURRENCY = int(os.getenv("MAX_LLM_CONCURRENCY", "48"))
+
+
+def invoke_many(llm: BaseChatModel, inputs: Sequence[Any],
+                max_concurrency: int = MAX_LLM_CONCURRENCY) -> List[Any]:
+    """
+    Führt mehrere unabhängige LLM-Aufrufe parallel aus.
+    
+    Args:
+        llm: LLM-Instanz aus get_llm
+        inputs: Prompts/Message-Listen, je ein Aufruf
+        max_concurrency: Max. gleichzeitige Requests
+        
+    Returns:
+        Antworten in der Reihenfolge von `inputs`
+    """
+    return llm.batch(list(inputs), config={"max_concurrency": max_concurrency})
+
+
+async def ainvoke_many(llm: BaseChatModel, inputs: Sequence[Any],
+                       max_concurrency: int = MAX_LLM_CONCURRENCY) -> List[Any]:
+    """Async-Variante von invoke_many."""
+    return await llm.abatch(list(inputs), config={"max_concurrency": max_concurrency})
+
+
 def get_embedding_model(provider: str = "openai"):
     """
     Gibt das Embedding-Modell für den Provider zurück.
@@ -131,7 +261,7 @@ def get_embedding_model(provider: str = "openai"):
     """
     if provider == "openai":
         from langchain_openai import OpenAIEmbeddings
-        logger.debug(f" Embedding-Modell: {EMBEDDING_MODEL}")
+        logger.debug(" Embedding-Modell: %s", EMBEDDING_MODEL)
         return OpenAIEmbeddings(model=EMBEDDING_MODEL)
     else:
         raise ValueError(f"Provider {provider} unterstützt keine Embeddings")
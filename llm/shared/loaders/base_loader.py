@@ -13,3 +13,58 @@ class BaseLoader(ABC):
 
     def load_page_documents (self, path: str) -> list[Document]:
         pass
+
+    @staticmethod
+    def _elements_to_documents(elements: list, path: str, doc_type: str) -> list[Document]:
+        """
+        Wandelt unstructured-Elemente in LangChain-Dokumente um
+        (wie die Unstructured*Loader im Modus "elements").
+        """
+        docs = []
+        for element in elements:
+            metadata = {"source": str(path)}
+            metadata.update(element.metadata.to_dict())
+            metadata["category"] = element.category
+            if element.id:
+                metadata["element_id"] = element.id
+            metadata.setdefault("type", doc_type)
+            # Einmal hier strippen, die Aggregationen nutzen den Text direkt
+            docs.append(Document(page_content=str(element).strip(), metadata=metadata))
+        return docs
+
+    @staticmethod
+    def _group_by_page(docs: list[Document], path: str, doc_type: str, unit_prefix: str) -> list[Document]:
+        """
+        Fasst Elemente (bereits gestrippt) mit gleicher `page_number` zu je einem Dokument zusammen.
+        Ein Durchlauf über die Elemente: solange die Seite gleich bleibt, wird
+        in denselben Puffer geschrieben; sortiert werden nur die Seiten.
+        """
+        groups = []      # (page, contents) in Reihenfolge des ersten Auftretens
+        by_page = {}     # page -> contents, falls eine Seite später erneut auftaucht
+        current_page, current = None, None
+
+        for doc in docs:
+            page = doc.metadata.get("page_number", 0)
+            if page != current_page:
+                current = by_page.get(page)
+                if current is None:
+                    current = by_page[page] = []
+                    groups.append((page, current))
+                current_page = page
+            current.append(doc.page_content)
+
+        # Elemente kommen praktisch immer in Seitenreihenfolge -> Timsort O(Seiten)
+        groups.sort(key=lambda group: group[0])
+
+        return [
+            Document(
+                page_content="\n\n".join(contents),
+                metadata={
+                    "source": str(path),
+                    "type": doc_type,
+                    "unit": f"{unit_prefix}_{page}",
+                    "elements": len(contents)
+                }
+            )
+            for page, contents in groups
+        ]
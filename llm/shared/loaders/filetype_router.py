@@ -2,22 +2,31 @@ from .powerpoint_loader import PowerPointLoader
 from .text_loader import TextLoader
 from .base_loader import BaseLoader
 from .pdf_loader import PDFLoader
-from pathlib import Path
+from functools import lru_cache
+import os
+
+# Dateiendung -> Loader-Klasse
+_SUFFIX_TO_LOADER = {
+    "py": TextLoader,
+    "java": TextLoader,
+    "js": TextLoader,
+    "txt": TextLoader,
+    "md": TextLoader,
+    "pptx": PowerPointLoader,
+    "pdf": PDFLoader,
+}
+
+@lru_cache(maxsize=8)
+def _loader_for_suffix(suffix: str) -> BaseLoader:
+    # Loader sind zustandslos -> eine Instanz pro Dateityp genügt
+    return _SUFFIX_TO_LOADER[suffix]()
 
 def get_loader(path: str) -> BaseLoader:
     """
     Gibt den passenden Loader anhand der Dateiendung des Pfads zurück.
     """
-    suffix = Path(path).suffix.lower().lstrip(".")
+    suffix = os.path.splitext(path)[1][1:].lower()
 
-    match suffix:
-        case "py" | "java" | "js":
-            return TextLoader()
-        case "txt" | "md":
-            return TextLoader()
-        case "pptx":
-            return PowerPointLoader()
-        case "pdf":
-            return PDFLoader()
-        case _:
-            raise ValueError(f"Kein Loader verfügbar für Dateityp: {suffix}")
\ No newline at end of file
+    if suffix not in _SUFFIX_TO_LOADER:
+        raise ValueError(f"Kein Loader verfügbar für Dateityp: {suffix}")
+    return _loader_for_suffix(suffix)
\ No newline at end of file
@@ -1,14 +1,18 @@
-from pathlib import Path
-from collections import defaultdict
+from functools import lru_cache
 from langchain_core.documents import Document
 import warnings
 
-# Unterdrücke die Warning BEVOR UnstructuredPDFLoader importiert wird
+# Unterdrücke die Warning BEVOR unstructured importiert wird
 warnings.filterwarnings("ignore", message=".*No languages specified.*")
 
-from langchain_community.document_loaders import UnstructuredPDFLoader
 from llm.shared.loaders.base_loader import BaseLoader
 
+@lru_cache(maxsize=1)
+def _partition_pdf():
+    """Importiert unstructured einmalig (beim ersten Dokument) und liefert partition_pdf."""
+    from unstructured.partition.pdf import partition_pdf
+    return partition_pdf
+
 class PDFLoader(BaseLoader):
     def __init__(self):
         self.mode = "elements"  # Für granulare Erkennung einzelner Textobjekte
@@ -18,7 +22,7 @@ class PDFLoader(BaseLoader):
         Gibt das gesamte PDF als zusammenhängenden Text-String zurück.
         """
         docs = self._load_docs(path)
-        return "\n\n".join(doc.page_content for doc in docs)
+        return "\n\n".join([doc.page_content for doc in docs])
 
     def load_as_document(self, path: str) -> Document:
         """
@@ -26,8 +30,8 @@ class PDFLoader(BaseLoader):
         Ideal für einfache Summarisierung o.ä.
         """
         docs = self._load_docs(path)
-        full_text = "\n\n".join(doc.page_content.strip() for doc in docs)
-        page_count = len(set(doc.metadata.get("page_number", 0) for doc in docs))
+        full_text = "\n\n".join([doc.page_content for doc in docs])
+        page_count = len({doc.metadata.get("page_number", 0) for doc in docs})
 
         return Document(
             page_content=full_text,
@@ -44,34 +48,13 @@ class PDFLoader(BaseLoader):
         Setzt `unit`-Feld als "page_1", "page_2", ...
         """
         docs = self._load_docs(path)
-        pages = defaultdict(list)
-
-        for doc in docs:
-            page = doc.metadata.get("page_number", 0)
-            pages[page].append(doc.page_content.strip())
-
-        return [
-            Document(
-                page_content="\n\n".join(contents),
-                metadata={
-                    "source": str(path),
-                    "type": "pdf",
-                    "unit": f"page_{page}",
-                    "elements": len(contents)
-                }
-            )
-            for page, contents in sorted(pages.items())
-        ]
+        return self._group_by_page(docs, path, "pdf", "page")
 
     def _load_docs(self, path: str) -> list[Document]:
-        if not Path(path).exists():
-            raise FileNotFoundError(f"Datei nicht gefunden: {path}")
-
-        loader = UnstructuredPDFLoader(path, mode=self.mode)
-        docs = loader.load()
-
-        for doc in docs:
-            doc.metadata.setdefault("source", str(path))
-            doc.metadata.setdefault("type", "pdf")
-
-        return docs
\ No newline at end of file
+        # Direkt partitionieren statt pro Datei einen UnstructuredPDFLoader zu bauen
+        # Kein eigener exists()-Check vorab: unstructured öffnet die Datei ohnehin
+        try:
+            elements = _partition_pdf()(filename=str(path))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Datei nicht gefunden: {path}") from None
+        return self._elements_to_documents(elements, path, "pdf")
\ No newline at end of file
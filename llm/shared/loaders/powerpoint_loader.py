@@ -1,9 +1,13 @@
-from pathlib import Path
-from collections import defaultdict
+from functools import lru_cache
 from langchain_core.documents import Document
-from langchain_community.document_loaders import UnstructuredPowerPointLoader
 from llm.shared.loaders.base_loader import BaseLoader
 
+@lru_cache(maxsize=1)
+def _partition_pptx():
+    """Importiert unstructured einmalig (beim ersten Dokument) und liefert partition_pptx."""
+    from unstructured.partition.pptx import partition_pptx
+    return partition_pptx
+
 class PowerPointLoader(BaseLoader):
     def __init__(self):
         self.mode = "elements"  # Granularer Extraktionsmodus
@@ -13,15 +17,15 @@ class PowerPointLoader(BaseLoader):
         Lädt alle Inhalte der Präsentation als zusammengefassten String.
         """
         docs = self._load_docs(path)
-        return "\n\n".join(doc.page_content for doc in docs)
+        return "\n\n".join([doc.page_content for doc in docs])
 
     def load_as_document(self, path: str) -> Document:
         """
         Gibt das gesamte PPTX als ein LangChain-Dokument zurück.
         """
         docs = self._load_docs(path)
-        full_text = "\n\n".join(doc.page_content.strip() for doc in docs)
-        slide_count = len(set(doc.metadata.get("page_number", 0) for doc in docs))
+        full_text = "\n\n".join([doc.page_content for doc in docs])
+        slide_count = len({doc.metadata.get("page_number", 0) for doc in docs})
 
         return Document(
             page_content=full_text,
@@ -38,34 +42,13 @@ class PowerPointLoader(BaseLoader):
         Setzt `unit`-Feld als "slide_1", "slide_2", ...
         """
         docs = self._load_docs(path)
-        slides = defaultdict(list)
-
-        for doc in docs:
-            slide = doc.metadata.get("page_number", 0)
-            slides[slide].append(doc.page_content.strip())
-
-        return [
-            Document(
-                page_content="\n\n".join(contents),
-                metadata={
-                    "source": str(path),
-                    "type": "presentation",
-                    "unit": f"slide_{slide}",
-                    "elements": len(contents)
-                }
-            )
-            for slide, contents in sorted(slides.items())
-        ]
+        return self._group_by_page(docs, path, "presentation", "slide")
 
     def _load_docs(self, path: str) -> list[Document]:
-        if not Path(path).exists():
-            raise FileNotFoundError(f"Datei nicht gefunden: {path}")
-
-        loader = UnstructuredPowerPointLoader(path, mode=self.mode)
-        docs = loader.load()
-
-        for doc in docs:
-            doc.metadata.setdefault("source", str(path))
-            doc.metadata.setdefault("type", "presentation")
-
-        return docs
\ No newline at end of file
+        # Direkt partitionieren statt pro Datei einen UnstructuredPowerPointLoader zu bauen
+        # Kein eigener exists()-Check vorab: unstructured öffnet die Datei ohnehin
+        try:
+            elements = _partition_pptx()(filename=str(path))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Datei nicht gefunden: {path}") from None
+        return self._elements_to_documents(elements, path, "presentation")
\ No newline at end of file
@@ -1,6 +1,5 @@
 # /llm/shared/loaders/text_loader.py
 
-from pathlib import Path
 from langchain_core.documents import Document
 from .base_loader import BaseLoader
 
@@ -10,13 +9,22 @@ class TextLoader(BaseLoader):
     """
 
     def load_as_string(self, path: str) -> str:
-        file_path = Path(path)
-        if not file_path.exists():
-            raise FileNotFoundError(f"Datei nicht gefunden: {path}")
+        # Einmal binär lesen; der latin-1-Fallback braucht keinen zweiten Read
         try:
-            return file_path.read_text(encoding="utf-8")
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Datei nicht gefunden: {path}") from None
+
+        try:
+            text = data.decode("utf-8")
         except UnicodeDecodeError:
-            return file_path.read_text(encoding="latin-1")
+            text = data.decode("latin-1")
+
+        # Zeilenenden wie im Textmodus (read_text) vereinheitlichen
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
 
     def load_as_document(self, path: str) -> Document:
         content = self.load_as_string(path)
@@ -1,18 +1,49 @@
 # logger.py
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+# .env vor dem ersten Lesen von LOG_LEVEL laden (überschreibt keine gesetzten Variablen)
+load_dotenv()
+
+# Alle Logger schreiben in eine Queue; ein Hintergrund-Thread gibt die
+# Records gesammelt auf stderr aus, damit Aufrufer nicht auf I/O warten
+_log_queue = queue.SimpleQueue()
+_stream_handler = logging.StreamHandler()
+_formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] %(name)s: %(message)s")
+_stream_handler.setFormatter(_formatter)
+_listener = QueueListener(_log_queue, _stream_handler)
+_listener.start()
+# Beim Beenden die restlichen Records noch ausgeben
+atexit.register(_listener.stop)
+
+# Aufgelöstes LOG_LEVEL, wird bis zu invalidate_log_level_cache() wiederverwendet
+_cached_level = None
+
+def _resolve_level() -> int:
+    global _cached_level
+    if _cached_level is None:
+        log_level_str = os.getenv("LOG_LEVEL", "ERROR").upper()
+        _cached_level = getattr(logging, log_level_str, logging.ERROR)
+    return _cached_level
+
+def invalidate_log_level_cache():
+    """Erzwingt erneutes Lesen von LOG_LEVEL beim nächsten get_logger()."""
+    global _cached_level
+    _cached_level = None
 
 def get_logger(name: str = None) -> logging.Logger:
     logger = logging.getLogger(name or "default")
 
+    log_level = _resolve_level()
+
     # WICHTIG: Verhindere doppelte Handler
     if not logger.handlers:
-        log_level_str = os.getenv("LOG_LEVEL", "ERROR").upper()
-        log_level = getattr(logging, log_level_str, logging.ERROR)
-
-        formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] %(name)s: %(message)s")
-        handler = logging.StreamHandler()
-        handler.setFormatter(formatter)
+        handler = QueueHandler(_log_queue)
+        handler.setLevel(log_level)
 
         logger.addHandler(handler)
         logger.setLevel(log_level)
@@ -22,8 +53,6 @@ def get_logger(name: str = None) -> logging.Logger:
         logger.propagate = False
     else:
         # Aktualisiere Log-Level bei bereits existierenden Loggern
-        log_level_str = os.getenv("LOG_LEVEL", "ERROR").upper()
-        log_level = getattr(logging, log_level_str, logging.ERROR)
         logger.setLevel(log_level)
         # Aktualisiere auch alle Handler
         for handler in logger.handlers:
@@ -36,8 +65,8 @@ def update_all_loggers():
     Aktualisiert das Log-Level aller existierenden Logger.
     Sollte nach Änderung von LOG_LEVEL aufgerufen werden.
     """
-    log_level_str = os.getenv("LOG_LEVEL", "ERROR").upper()
-    log_level = getattr(logging, log_level_str, logging.ERROR)
+    invalidate_log_level_cache()
+    log_level = _resolve_level()
     
     # Aktualisiere alle existierenden Logger
     for name in logging.root.manager.loggerDict: